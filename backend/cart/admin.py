@@ -1,11 +1,14 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderItem
+from .models import Cart, CartItem, Order, OrderItem, StockReservation
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_items', 'total_price', 'created_at']
     list_filter = ['created_at']
     search_fields = ['user__username']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user').with_items()
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
@@ -25,3 +28,9 @@ class OrderItemAdmin(admin.ModelAdmin):
     list_display = ['order', 'product', 'quantity', 'price']
     list_filter = ['order__status']
     search_fields = ['order__user__username', 'product__name']
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['product', 'cart', 'quantity', 'expires_at']
+    list_filter = ['expires_at']
+    search_fields = ['product__name', 'cart__user__username']
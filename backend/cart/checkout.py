@@ -0,0 +1,148 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models import F
+
+from products import cache as catalog_cache
+from products.models import Product
+from .models import Cart, CartItem, Order, OrderItem
+from . import reservations
+
+CANCELLABLE_STATUSES = ('pending', 'processing')
+
+
+class CheckoutError(Exception):
+    """
+    Base error for checkouts that cannot be completed
+    """
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.message = message
+        self.details = details or {}
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class InsufficientStockError(CheckoutError):
+    pass
+
+
+def checkout_cart(user, shipping_address, payment_method, status='processing'):
+    """
+    Turn the user's cart into an order inside a single transaction.
+
+    Units the cart holds through stock reservations are already out of
+    Product.stock, so the holds are just consumed. Only the unheld rest
+    (holds that expired and were swept, or lines added before holds existed)
+    is taken from stock: those product rows are locked in id order (so
+    concurrent checkouts never deadlock) and decremented by one conditional
+    UPDATE that only matches rows with enough stock. Order items are bulk
+    inserted and the cart is emptied. The number of queries does not depend
+    on the cart size.
+    Raises Cart.DoesNotExist, EmptyCartError or InsufficientStockError.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.get(user=user)
+        items = list(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+        if not items:
+            raise EmptyCartError('Cart is empty')
+
+        quantities = dict(items)
+        held = reservations.convert(cart)
+        needed = {
+            product_id: quantity - held.get(product_id, 0)
+            for product_id, quantity in quantities.items()
+            if quantity > held.get(product_id, 0)
+        }
+        surplus = {
+            product_id: quantity - quantities.get(product_id, 0)
+            for product_id, quantity in held.items()
+            if quantity > quantities.get(product_id, 0)
+        }
+
+        products = {}
+        if needed:
+            products.update(
+                (product.id, product)
+                for product in Product.objects.select_for_update().filter(id__in=needed).order_by('id')
+            )
+        if len(products) < len(quantities):
+            products.update(
+                (product.id, product)
+                for product in Product.objects.filter(id__in=quantities).exclude(id__in=needed)
+            )
+
+        short = [
+            {
+                'product_id': product_id,
+                'name': products[product_id].name,
+                'requested': quantities[product_id],
+                'available': products[product_id].stock + held.get(product_id, 0),
+            }
+            for product_id, quantity in needed.items()
+            if products[product_id].stock < quantity
+        ]
+        if short:
+            raise InsufficientStockError('Insufficient stock', {'products': short})
+
+        if needed:
+            # Only rows that still have enough stock are updated; anything less
+            # than a full match means stock moved underneath us
+            requested = reservations.quantity_case(needed)
+            updated = Product.objects.filter(
+                id__in=needed, stock__gte=requested
+            ).update(stock=F('stock') - requested, updated_at=Now())
+            if updated != len(needed):
+                raise InsufficientStockError('Insufficient stock')
+
+        if surplus:
+            Product.objects.filter(id__in=surplus).update(
+                stock=F('stock') + reservations.quantity_case(surplus), updated_at=Now()
+            )
+        catalog_cache.invalidate_stock([*needed, *surplus])
+
+        order = Order.objects.create(
+            user=user,
+            shipping_address=shipping_address,
+            payment_method=payment_method,
+            total_amount=sum(products[pid].price * quantity for pid, quantity in quantities.items()),
+            status=status,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=pid, quantity=quantity, price=products[pid].price)
+            for pid, quantity in quantities.items()
+        ])
+
+        CartItem.objects.filter(cart=cart).delete()
+        cart.touch()
+
+    return order
+
+
+def cancel_order(order):
+    """
+    Cancel the order and give its units back to stock inside a single
+    transaction. The status changes with one conditional UPDATE, so of two
+    concurrent cancellations only one restocks, and every product is
+    restocked by one set-based UPDATE.
+    Returns False when the order is no longer in a cancellable status.
+    """
+    with transaction.atomic():
+        cancelled = Order.objects.filter(pk=order.pk, status__in=CANCELLABLE_STATUSES).update(
+            status='cancelled', updated_at=Now()
+        )
+        if not cancelled:
+            return False
+
+        quantities = defaultdict(int)
+        for product_id, quantity in OrderItem.objects.filter(order=order).values_list('product_id', 'quantity'):
+            quantities[product_id] += quantity
+        if quantities:
+            Product.objects.filter(id__in=quantities).update(
+                stock=F('stock') + reservations.quantity_case(quantities), updated_at=Now()
+            )
+            catalog_cache.invalidate_stock(quantities)
+    return True
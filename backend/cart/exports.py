@@ -0,0 +1,47 @@
+from .models import Order, OrderItem
+
+# (header, lookup) pairs for the order history exports
+ORDER_COLUMNS = [
+    ('id', 'id'),
+    ('user_id', 'user_id'),
+    ('username', 'user__username'),
+    ('status', 'status'),
+    ('payment_method', 'payment_method'),
+    ('total_amount', 'total_amount'),
+    ('shipping_address', 'shipping_address'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+ORDER_ITEM_COLUMNS = [
+    ('id', 'id'),
+    ('order_id', 'order_id'),
+    ('order_created_at', 'order__created_at'),
+    ('order_status', 'order__status'),
+    ('user_id', 'order__user_id'),
+    ('product_id', 'product_id'),
+    ('product_name', 'product__name'),
+    ('quantity', 'quantity'),
+    ('price', 'price'),
+]
+
+
+def order_export_queryset(user=None, status=None):
+    """
+    Orders by id; user limits the export to that user's orders
+    """
+    queryset = Order.objects.order_by('id')
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+
+def order_item_export_queryset(user=None, status=None):
+    queryset = OrderItem.objects.order_by('order_id', 'id')
+    if user is not None:
+        queryset = queryset.filter(order__user=user)
+    if status:
+        queryset = queryset.filter(order__status=status)
+    return queryset
@@ -0,0 +1,184 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+DEFAULT_TTL = timedelta(hours=24)
+DEFAULT_LEASE = timedelta(seconds=60)
+MAX_KEY_LENGTH = 255
+
+
+def get_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL)
+
+
+def get_lease():
+    return getattr(settings, 'IDEMPOTENCY_KEY_LEASE', DEFAULT_LEASE)
+
+
+def _fingerprint(action, request, kwargs):
+    payload = json.dumps(
+        [action, kwargs, request.data], sort_keys=True, cls=DjangoJSONEncoder, default=str
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _claim(user, key, action, fingerprint):
+    """
+    Create the key row for a first request, or return the existing one
+    as (record, created)
+    """
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user,
+                    key=key,
+                    action=action,
+                    fingerprint=fingerprint,
+                    locked_until=timezone.now() + get_lease(),
+                    expires_at=timezone.now() + get_ttl(),
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at > timezone.now():
+                return record, False
+            # An expired key is free to be used again
+            IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=timezone.now()).delete()
+    return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+class Superseded(Exception):
+    """
+    Raised to roll back a request whose key was taken over by a retry
+    """
+    pass
+
+
+def _take_over(record):
+    """
+    Claim an unfinished key whose lease ran out (its request died with the
+    worker that ran it, or is still running). Returns whether this request
+    now owns it; its locked_until is the new owner's lease.
+    """
+    now = timezone.now()
+    stale = Q(locked_until__isnull=True) | Q(locked_until__lte=now)
+    record.locked_until = now + get_lease()
+    return IdempotencyKey.objects.filter(stale, pk=record.pk, status_code__isnull=True).update(
+        locked_until=record.locked_until
+    ) == 1
+
+
+def _owned(record):
+    # The key row while this request still holds the lease it claimed it with
+    return IdempotencyKey.objects.filter(pk=record.pk, locked_until=record.locked_until)
+
+
+def idempotent(view_func):
+    """
+    Make a POST action safe to retry: when the client sends an Idempotency-Key
+    header, the first response is stored and every retry with the same key
+    gets it back without running the action again. Retries while it runs
+    get 409, until IDEMPOTENCY_KEY_LEASE has passed without an outcome.
+
+    The action and the stored outcome commit in one transaction, so a
+    request that dies leaves nothing behind for the retry to repeat, and
+    one that outlived its lease and was taken over rolls back (and answers
+    409) instead of committing a second time.
+    """
+    @wraps(view_func)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_func(self, request, *args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        action = view_func.__name__
+        fingerprint = _fingerprint(action, request, kwargs)
+        record, created = _claim(request.user, key, action, fingerprint)
+
+        if not created:
+            if record.action != action or record.fingerprint != fingerprint:
+                return Response(
+                    {'error': f'{HEADER} was already used for a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record.status_code is not None:
+                replay = HttpResponse(bytes(record.body), status=record.status_code, content_type=record.content_type)
+                replay['Idempotent-Replayed'] = 'true'
+                return replay
+            if not _take_over(record):
+                return Response(
+                    {'error': f'A request with this {HEADER} is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+        try:
+            with transaction.atomic():
+                response = view_func(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    # Server errors are not final: let the client retry for real
+                    _owned(record).delete()
+                    return response
+
+                # Rendered now, with the negotiated renderer, so retries get
+                # the very bytes of this response
+                response.accepted_renderer = request.accepted_renderer
+                response.accepted_media_type = request.accepted_media_type
+                response.renderer_context = self.get_renderer_context()
+                response.render()
+                # The key row stays locked until commit, so a retry trying to
+                # take it over waits and then sees the outcome
+                stored = _owned(record).update(
+                    status_code=response.status_code,
+                    content_type=response['Content-Type'],
+                    body=response.content,
+                    locked_until=None,
+                )
+                if not stored:
+                    raise Superseded
+        except Superseded:
+            return Response(
+                {'error': f'A retry with this {HEADER} took over the request'},
+                status=status.HTTP_409_CONFLICT
+            )
+        except Exception:
+            _owned(record).delete()
+            raise
+        return response
+
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """
+    Delete expired keys in batches. Returns the number of deleted rows.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
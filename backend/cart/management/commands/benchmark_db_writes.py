@@ -0,0 +1,93 @@
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+
+from tienda_backend.database import database_config
+
+SCHEMA = (
+    'CREATE TABLE bench_product (id INTEGER PRIMARY KEY, stock INTEGER NOT NULL)',
+    'CREATE TABLE bench_order_line ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL, quantity INTEGER NOT NULL)',
+)
+
+PROFILES = {
+    'default': {'SQLITE_TUNING': 'false'},
+    'tuned': {},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent checkout-like write transactions on a temporary '
+        'SQLite database with Django\'s default settings and with the tuned profile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='Concurrent threads, one connection each')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration per profile')
+        parser.add_argument('--products', type=int, default=20)
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append', help='Default: all')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"profile":<10}{"commits":>10}{"tx/s":>10}{"locked":>10}')
+        for profile in options['profile'] or PROFILES:
+            with tempfile.TemporaryDirectory() as directory:
+                committed, locked = self.run(profile, Path(directory) / 'bench.sqlite3', options)
+            rate = committed / options['seconds']
+            self.stdout.write(f'{profile:<10}{committed:>10}{rate:>10.0f}{locked:>10}')
+
+    def run(self, profile, path, options):
+        alias = f'benchmark_{profile}'
+        env = {**PROFILES[profile], 'DATABASE_URL': f'sqlite:///{path}'}
+        configured = connections.configure_settings({'default': database_config(env)})
+        connections.settings[alias] = configured['default']
+        try:
+            with connections[alias].cursor() as cursor:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+                cursor.executemany(
+                    'INSERT INTO bench_product (id, stock) VALUES (%s, %s)',
+                    [(i, 10 ** 9) for i in range(1, options['products'] + 1)],
+                )
+            connections[alias].close()
+
+            counts = [[0, 0] for _ in range(options['writers'])]
+            deadline = time.monotonic() + options['seconds']
+            threads = [
+                threading.Thread(target=self.write, args=(alias, i, options['products'], deadline, counts[i]))
+                for i in range(options['writers'])
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return sum(count[0] for count in counts), sum(count[1] for count in counts)
+        finally:
+            del connections.settings[alias]
+
+    def write(self, alias, writer, products, deadline, counts):
+        """
+        Checkout-shaped transactions: read a product's stock, decrement it and
+        insert an order line. Counts commits and "database is locked" failures.
+        """
+        product_id = writer % products + 1
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    with transaction.atomic(using=alias), connections[alias].cursor() as cursor:
+                        cursor.execute('SELECT stock FROM bench_product WHERE id = %s', [product_id])
+                        cursor.fetchone()
+                        cursor.execute('UPDATE bench_product SET stock = stock - 1 WHERE id = %s', [product_id])
+                        cursor.execute(
+                            'INSERT INTO bench_order_line (product_id, quantity) VALUES (%s, 1)', [product_id]
+                        )
+                    counts[0] += 1
+                except DatabaseError:
+                    counts[1] += 1
+                product_id = product_id % products + 1
+        finally:
+            connections[alias].close()
@@ -0,0 +1,121 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from cart.models import Cart, CartItem, Order, OrderItem
+from cart.serializers import CartSerializer, OrderSerializer
+from products.models import Category, Product
+from products.serializers import ProductSerializer
+from tienda_backend import fast_serializers
+from tienda_backend.sparse import nested_columns, only_emitted
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare DRF serializers with the compiled fast serialization plans on '
+        'generated data (rolled back afterwards); fails if their output differs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--items', type=int, default=5, help='Lines per order and cart')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        products, orders, cart = self.create_data(options)
+        request = Request(APIRequestFactory().get('/api/products/'))
+        context = {'request': request}
+
+        def product_list(fast):
+            serializer = ProductSerializer(many=True, context=context)
+            if fast:
+                return fast_serializers.serialize(products, serializer)
+            return ProductSerializer(only_emitted(products, serializer), many=True, context=context).data
+
+        def order_list(fast):
+            serializer = OrderSerializer(many=True, context=context)
+            if fast:
+                return fast_serializers.serialize(orders, serializer)
+            queryset = orders.with_items(nested_columns(serializer, 'items'))
+            return OrderSerializer(queryset, many=True, context=context).data
+
+        def my_cart(fast):
+            serializer = CartSerializer(context=context)
+            if fast:
+                return fast_serializers.serialize(Cart.objects.filter(pk=cart.pk), serializer)[0]
+            queryset = Cart.objects.with_items(nested_columns(serializer, 'items'))
+            return CartSerializer(queryset.get(pk=cart.pk), context=context).data
+
+        self.stdout.write(f'{"case":<14}{"DRF ms":>10}{"fast ms":>10}{"speedup":>10}')
+        for name, case in (('product list', product_list), ('order list', order_list), ('cart', my_cart)):
+            renderer = JSONRenderer()
+            if renderer.render(case(False)) != renderer.render(case(True)):
+                raise CommandError(f'{name}: fast serialization output differs from the serializer')
+            slow = self.measure(case, False, options['repeat'])
+            fast = self.measure(case, True, options['repeat'])
+            self.stdout.write(f'{name:<14}{slow * 1000:>10.1f}{fast * 1000:>10.1f}{slow / fast:>9.1f}x')
+
+    def measure(self, case, fast, repeat):
+        """
+        Best of repeat runs, queries included
+        """
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            case(fast)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def create_data(self, options):
+        user = User.objects.create_user(username='benchmark-serializers')
+        category = Category.objects.create(name='Benchmark', description='Generated for benchmark_serializers')
+        products = Product.objects.bulk_create([
+            Product(
+                name=f'Benchmark product {i}',
+                description='Generated product ' * 10,
+                price=Decimal('19.99') + i,
+                stock=i % 7,
+                category=category,
+                image=f'products/benchmark-{i}.jpg' if i % 2 else '',
+            )
+            for i in range(max(options['products'], options['items']))
+        ])
+        lines = products[:options['items']]
+
+        orders = Order.objects.bulk_create([
+            Order(user=user, total_amount=Decimal('100.00'), shipping_address='Calle 1', payment_method='paypal')
+            for _ in range(options['orders'])
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price=product.price)
+            for order in orders for product in lines
+        ])
+
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=3) for product in lines])
+
+        return (
+            Product.objects.filter(category=category).order_by('id'),
+            Order.objects.filter(user=user).order_by('id'),
+            cart,
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from cart.exports import ORDER_COLUMNS, ORDER_ITEM_COLUMNS, order_export_queryset, order_item_export_queryset
+from tienda_backend import exports
+
+
+class Command(BaseCommand):
+    help = 'Export orders (or, with --items, order lines) as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', action='store_true', help='Export order lines instead of orders')
+        parser.add_argument('--format', dest='file_format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write; standard output when omitted')
+        parser.add_argument('--status')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options['items']:
+            queryset = order_item_export_queryset(status=options['status'])
+            columns = ORDER_ITEM_COLUMNS
+        else:
+            queryset = order_export_queryset(status=options['status'])
+            columns = ORDER_COLUMNS
+
+        if not options['output']:
+            exports.write_export(self.stdout, queryset, columns, options['file_format'], options['chunk_size'])
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as stream:
+            count = exports.write_export(stream, queryset, columns, options['file_format'], options['chunk_size'])
+        label = 'order lines' if options['items'] else 'orders'
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} {label} to {options["output"]}'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-16 23:26
+
+import json
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def render_stored_responses(apps, schema_editor):
+    # Stored data becomes the body retries get; unfinished requests get a
+    # lease, as if they had just started
+    IdempotencyKey = apps.get_model('cart', 'IdempotencyKey')
+    db = schema_editor.connection.alias
+    for record in IdempotencyKey.objects.using(db).exclude(status_code=None).iterator():
+        record.body = json.dumps(record.response, separators=(',', ':')).encode('utf-8')
+        record.content_type = 'application/json'
+        record.save(update_fields=['body', 'content_type'])
+    IdempotencyKey.objects.using(db).filter(status_code=None).update(
+        locked_until=timezone.now() + timedelta(minutes=1)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='body',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='locked_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(render_stored_responses, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='idempotencykey',
+            name='response',
+        ),
+    ]
@@ -1,15 +1,48 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from products.models import Product
+from tienda_backend.sparse import related_paths
+
+def _item_rows(model, parent, columns, *required):
+    if columns is None:
+        return model.objects.select_related('product__category')
+    # The parent key is needed to attach each row to its cart or order
+    columns = [parent, *required, *columns]
+    queryset = model.objects.only(*columns)
+    related = related_paths(columns)
+    return queryset.select_related(*related) if related else queryset
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self, columns=None):
+        """
+        Load the items with their product and category in one extra query,
+        so serializing a cart and its totals costs the same for any cart size.
+        columns limits the item rows to those fields (see tienda_backend.sparse)
+        plus what the cart totals need.
+        """
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=_item_rows(CartItem, 'cart', columns, 'quantity', 'product__price'))
+        )
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CartQuerySet.as_manager()
+    
     def __str__(self):
         return f"Cart for {self.user.username}"
     
+    def touch(self):
+        """
+        Bump updated_at without rewriting the row, so cart validators
+        (ETag / Last-Modified) change whenever the cart lines change
+        """
+        self.updated_at = timezone.now()
+        Cart.objects.filter(pk=self.pk).update(updated_at=self.updated_at)
+    
     @property
     def total_items(self):
         return sum(item.quantity for item in self.items.all())
@@ -34,6 +67,16 @@ class CartItem(models.Model):
     class Meta:
         unique_together = ['cart', 'product']
 
+class OrderQuerySet(models.QuerySet):
+    def with_items(self, columns=None):
+        """
+        Load the order items with their product and category in one extra query;
+        columns limits the item rows to those fields
+        """
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=_item_rows(OrderItem, 'order', columns))
+        )
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -59,6 +102,19 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = OrderQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            # Back keyset pagination on (created_at, id) for staff and per-user listings
+            models.Index(fields=['created_at', 'id'], name='order_created_id_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_id_idx'),
+            # Status filters (admin, exports)
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+            # Conditional GET validators (COUNT, MAX(updated_at)) read from the index alone
+            models.Index(fields=['updated_at'], name='order_updated_idx'),
+        ]
+    
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -70,3 +126,52 @@ class OrderItem(models.Model):
     
     def __str__(self):
         return f"{self.quantity}x {self.product.name} in Order {self.order.id}"
+
+class StockReservation(models.Model):
+    """
+    Stock held for a cart line until expires_at. The held units are already
+    taken out of Product.stock; checkout converts them into the sale and the
+    sweeper (release_expired_reservations) gives expired holds back.
+    Holds outlive a deleted cart (cart becomes NULL) until they expire.
+    """
+    cart = models.ForeignKey(Cart, on_delete=models.SET_NULL, null=True, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['cart', 'product']
+        indexes = [
+            models.Index(fields=['expires_at'], name='reservation_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} held until {self.expires_at}"
+
+class IdempotencyKey(models.Model):
+    """
+    First outcome of a POST sent with an Idempotency-Key header, replayed to
+    retries of the same request (the rendered body, byte for byte) until
+    expires_at. status_code is NULL while the first request is still
+    running; one still unfinished at locked_until is presumed dead, and a
+    retry takes it over.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    action = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(null=True)
+    locked_until = models.DateTimeField(null=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ['user', 'key']
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.action} {self.key}"
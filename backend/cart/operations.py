@@ -0,0 +1,220 @@
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from products.models import Product
+from tienda_backend.parsing import parse_int
+from .models import CartItem
+from . import reservations
+
+
+class CartOperationError(Exception):
+    """
+    Raised when a cart mutation cannot be applied
+    """
+    status_code = 400
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class ProductNotFoundError(CartOperationError):
+    status_code = 404
+
+
+class ItemNotFoundError(CartOperationError):
+    status_code = 404
+
+
+class InsufficientStockError(CartOperationError):
+    pass
+
+
+class StockConflictError(CartOperationError):
+    status_code = 409
+
+
+def _add_item_sql(connection):
+    item_table = connection.ops.quote_name(CartItem._meta.db_table)
+    # Insert the line, or bump the quantity of the existing one, in a single
+    # statement so parallel requests cannot lose updates. Stock is checked
+    # (and held) by the reservation taken just before.
+    return f"""
+        INSERT INTO {item_table} (cart_id, product_id, quantity, added_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (cart_id, product_id) DO UPDATE
+        SET quantity = {item_table}.quantity + excluded.quantity
+    """
+
+
+def _diagnose(cart, product_id, item_required=False):
+    """
+    Work out why a mutation could not be applied (failure path only)
+    """
+    if item_required:
+        if not CartItem.objects.filter(cart=cart, product_id=product_id).exists():
+            raise ItemNotFoundError('Item not found in cart')
+    elif not Product.objects.filter(id=product_id, is_active=True).exists():
+        raise ProductNotFoundError('Product not found')
+    raise InsufficientStockError('Insufficient stock')
+
+
+def add_item(cart, product_id, quantity):
+    """
+    Hold quantity more units of a product for the cart, then add them
+    to the cart line with one upsert statement
+    """
+    connection = connections[router.db_for_write(CartItem)]
+    with transaction.atomic(using=connection.alias):
+        try:
+            reservations.reserve(cart, product_id, quantity)
+        except reservations.StockUnavailable:
+            _diagnose(cart, product_id)
+        with connection.cursor() as cursor:
+            cursor.execute(_add_item_sql(connection), [cart.pk, product_id, quantity, timezone.now()])
+        cart.touch()
+
+
+def set_item_quantity(cart, product_id, quantity):
+    """
+    Set the quantity of a line already in the cart (and its hold); 0 removes it.
+    Returns a short description of what happened.
+    """
+    if quantity == 0:
+        remove_item(cart, product_id)
+        return 'Item removed from cart'
+
+    with transaction.atomic():
+        if not CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=quantity):
+            raise ItemNotFoundError('Item not found in cart')
+        try:
+            reservations.set_reserved(cart, {product_id: quantity})
+        except reservations.StockUnavailable:
+            raise InsufficientStockError('Insufficient stock')
+        cart.touch()
+    return 'Item quantity updated'
+
+
+def remove_item(cart, product_id):
+    with transaction.atomic():
+        deleted, _ = CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+        if not deleted:
+            raise ItemNotFoundError('Item not found in cart')
+        reservations.release(cart, [product_id])
+        cart.touch()
+
+
+def clear(cart):
+    """
+    Remove every line from the cart and give its holds back.
+    Returns the number of removed lines.
+    """
+    with transaction.atomic():
+        reservations.release(cart)
+        deleted, _ = CartItem.objects.filter(cart=cart).delete()
+        if deleted:
+            cart.touch()
+    return deleted
+
+
+BATCH_OPERATIONS = ('add', 'remove', 'update')
+MAX_BATCH_OPERATIONS = 100
+
+
+def apply_batch(cart, operations):
+    """
+    Apply a list of {'op', 'product_id', 'quantity'} operations in order.
+
+    The cart lines, their holds and the referenced products are read once,
+    the operations are replayed in memory and the outcome is written back
+    with one DELETE and one bulk upsert for the lines plus one set-based
+    adjustment of the holds, all in a single transaction. Operations that fail
+    (unknown product, insufficient stock, line not in cart, bad input) are
+    skipped and reported; the rest are applied.
+    Returns one {'index', 'status'} or {'index', 'error'} entry per operation.
+    """
+    results = []
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in BATCH_OPERATIONS:
+            results.append({'index': index, 'error': f'op must be one of: {", ".join(BATCH_OPERATIONS)}'})
+            continue
+        product_id = parse_int(operation.get('product_id'))
+        if product_id is None:
+            results.append({'index': index, 'error': 'Product ID is required'})
+            continue
+        default_quantity = 1 if operation['op'] == 'add' else 0
+        quantity = parse_int(operation.get('quantity', default_quantity))
+        minimum = 1 if operation['op'] == 'add' else 0
+        if quantity is None or quantity < minimum:
+            results.append({'index': index, 'error': 'Invalid quantity'})
+            continue
+        results.append(None)
+        parsed.append((index, operation['op'], product_id, quantity))
+
+    with transaction.atomic():
+        product_ids = {product_id for _, _, product_id, _ in parsed}
+        products = {
+            product['id']: product
+            for product in Product.objects.filter(id__in=product_ids).values('id', 'stock', 'is_active')
+        }
+        current = dict(
+            CartItem.objects.select_for_update()
+            .filter(cart=cart, product_id__in=product_ids)
+            .values_list('product_id', 'quantity')
+        )
+        held = reservations.held_quantities(cart, product_ids)
+        lines = dict(current)
+
+        for index, op, product_id, quantity in parsed:
+            product = products.get(product_id)
+            if op == 'add':
+                if product is None or not product['is_active']:
+                    results[index] = {'index': index, 'error': 'Product not found'}
+                    continue
+                new_quantity = lines.get(product_id, 0) + quantity
+            elif product_id not in lines:
+                results[index] = {'index': index, 'error': 'Item not found in cart'}
+                continue
+            elif op == 'remove':
+                new_quantity = 0
+            else:
+                new_quantity = quantity
+
+            # Units this cart already holds are out of stock but still available to it
+            if new_quantity and new_quantity > product['stock'] + held.get(product_id, 0):
+                results[index] = {'index': index, 'error': 'Insufficient stock'}
+                continue
+
+            if new_quantity:
+                lines[product_id] = new_quantity
+            else:
+                del lines[product_id]
+            results[index] = {'index': index, 'status': 'ok'}
+
+        removed = [product_id for product_id in current if product_id not in lines]
+        if removed:
+            CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+
+        changed = [
+            CartItem(cart=cart, product_id=product_id, quantity=quantity)
+            for product_id, quantity in lines.items()
+            if current.get(product_id) != quantity
+        ]
+        if changed:
+            CartItem.objects.bulk_create(
+                changed,
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+
+        touched = set(removed) | {item.product_id for item in changed}
+        if touched:
+            try:
+                reservations.set_reserved(cart, {product_id: lines.get(product_id, 0) for product_id in touched})
+            except reservations.StockUnavailable:
+                raise StockConflictError('Stock changed while applying the batch, please retry')
+            cart.touch()
+
+    return results
@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import Coalesce, Now
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from products import cache as catalog_cache
+from products.models import Product
+from .models import StockReservation
+
+DEFAULT_TTL = timedelta(minutes=15)
+
+
+class StockUnavailable(Exception):
+    """
+    Raised when a hold cannot be taken because the product is inactive
+    or does not have enough free stock
+    """
+    pass
+
+
+def get_ttl():
+    return getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL)
+
+
+def quantity_case(quantities):
+    """
+    CASE expression mapping product id -> quantity, for set-based stock updates
+    """
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def held_stock(product_ids):
+    """
+    Return {product_id: units held by all carts} for the products that have
+    holds. Expired holds count until release_expired() gives them back.
+    """
+    return dict(
+        StockReservation.objects.filter(product_id__in=product_ids)
+        .order_by()
+        .values('product_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+
+def on_hand_error(product_id, quantity):
+    """
+    Why quantity units on hand cannot be set for the product (carts hold
+    more than that), or None when they can
+    """
+    held = held_stock([product_id]).get(product_id, 0)
+    if quantity < held:
+        return f'{held} units are held in carts, stock cannot be set below that'
+    return None
+
+
+def held_units():
+    """
+    Units held by all carts for the Product row being read or updated, as
+    an expression (0 without holds)
+    """
+    held = (
+        StockReservation.objects.filter(product=OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(total=Sum('quantity'))
+        .values('total')
+    )
+    return Coalesce(Subquery(held), 0)
+
+
+def on_hand(quantity):
+    """
+    The Product.stock to write for quantity units on hand. Product.stock is
+    free stock and every hold gives its units back on release, so absolute
+    writes subtract the outstanding holds in the same statement.
+    """
+    return Value(quantity) - held_units()
+
+
+def held_quantities(cart, product_ids=None):
+    """
+    Return {product_id: held quantity} for the cart, locking the hold rows.
+    Must be called inside a transaction.
+    """
+    holds = StockReservation.objects.select_for_update().filter(cart=cart)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    return dict(holds.values_list('product_id', 'quantity'))
+
+
+def _apply(cart, held, targets):
+    """
+    Move the cart's holds from held to targets ({product_id: quantity}).
+    Extra units are taken from Product.stock with one conditional UPDATE,
+    surplus units are given back with another, and the hold rows are
+    rewritten with a fresh expiry in one bulk upsert.
+    """
+    take = {}
+    give = {}
+    for product_id, target in targets.items():
+        delta = target - held.get(product_id, 0)
+        if delta > 0:
+            take[product_id] = delta
+        elif delta < 0:
+            give[product_id] = -delta
+
+    if take:
+        requested = quantity_case(take)
+        updated = Product.objects.filter(
+            id__in=take, is_active=True, stock__gte=requested
+        ).update(stock=F('stock') - requested, updated_at=Now())
+        if updated != len(take):
+            raise StockUnavailable('Insufficient stock')
+
+    if give:
+        Product.objects.filter(id__in=give).update(
+            stock=F('stock') + quantity_case(give), updated_at=Now()
+        )
+    catalog_cache.invalidate_stock([*take, *give])
+
+    dropped = [product_id for product_id, target in targets.items() if target <= 0 and product_id in held]
+    if dropped:
+        StockReservation.objects.filter(cart=cart, product_id__in=dropped).delete()
+
+    expires_at = timezone.now() + get_ttl()
+    kept = [
+        StockReservation(cart=cart, product_id=product_id, quantity=target, expires_at=expires_at)
+        for product_id, target in targets.items()
+        if target > 0
+    ]
+    if kept:
+        StockReservation.objects.bulk_create(
+            kept,
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+
+
+def reserve(cart, product_id, quantity):
+    """
+    Hold quantity more units of a product for the cart and renew the hold
+    """
+    with transaction.atomic():
+        held = held_quantities(cart, [product_id])
+        _apply(cart, held, {product_id: held.get(product_id, 0) + quantity})
+
+
+def set_reserved(cart, targets):
+    """
+    Make the cart hold exactly targets[product_id] units of each product
+    """
+    with transaction.atomic():
+        _apply(cart, held_quantities(cart, list(targets)), targets)
+
+
+def release(cart, product_ids=None):
+    """
+    Give the cart's holds (all of them, or only for product_ids) back to stock
+    """
+    with transaction.atomic():
+        held = held_quantities(cart, product_ids)
+        if held:
+            _apply(cart, held, {product_id: 0 for product_id in held})
+
+
+def convert(cart):
+    """
+    Consume the cart's holds at checkout. The held units are already out of
+    Product.stock, so they are simply deleted and returned as
+    {product_id: quantity} for the caller to account for.
+    Must be called inside the checkout transaction.
+    """
+    held = held_quantities(cart)
+    if held:
+        StockReservation.objects.filter(cart=cart).delete()
+    return held
+
+
+def release_expired(batch_size=1000, now=None):
+    """
+    Give expired holds back to stock in batches. Each batch is one
+    transaction with one set-based stock UPDATE and one DELETE.
+    Returns the number of released holds.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not rows:
+                break
+
+            returned = defaultdict(int)
+            for _, product_id, quantity in rows:
+                returned[product_id] += quantity
+            Product.objects.filter(id__in=returned).update(
+                stock=F('stock') + quantity_case(returned), updated_at=Now()
+            )
+            catalog_cache.invalidate_stock(returned)
+            StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+        released += len(rows)
+        if len(rows) < batch_size:
+            break
+    return released
@@ -1,29 +1,99 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from django.contrib.auth.models import User
+from django.db.models import Count, Max
 from django.shortcuts import get_object_or_404
 from .models import Cart, CartItem, Order, OrderItem
 from .serializers import CartSerializer, CartItemSerializer, OrderSerializer, OrderItemSerializer
+from .checkout import CANCELLABLE_STATUSES, cancel_order, checkout_cart, CheckoutError
+from . import operations
+from .idempotency import idempotent
+from .exports import ORDER_COLUMNS, ORDER_ITEM_COLUMNS, order_export_queryset, order_item_export_queryset
 from products.models import Product
+from tienda_backend.conditional import (
+    ConditionalGetMixin, latest, list_validators, make_version, row_validators
+)
+from tienda_backend.exports import requested_format, streaming_export
+from tienda_backend.pagination import KeysetPagination
+from tienda_backend.parsing import parse_int
+from tienda_backend.routing import ReplicaReadMixin
+from tienda_backend import fast_serializers
+from tienda_backend.fast_serializers import FastListMixin
+from tienda_backend.sparse import nested_columns
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Reading the cart only needs the user id from the token (no user lookup)
+    claims_only_actions = ('my_cart',)
     
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return Cart.objects.filter(user=self.request.user).with_items()
+    
+    def get_cart_data(self, cart):
+        """
+        Serialize a cart from a freshly prefetched copy, so the response
+        costs a constant number of queries whatever the cart size
+        """
+        data = self.fast_cart_data(Cart.objects.filter(pk=cart.pk), CartSerializer())
+        if data is not None:
+            return data
+        cart = Cart.objects.with_items().get(pk=cart.pk)
+        return CartSerializer(cart).data
+    
+    def fast_cart_data(self, queryset, serializer):
+        """
+        The cart built from a compiled plan (two queries), or None when fast
+        serialization is off or the cart does not exist
+        """
+        if not fast_serializers.is_enabled():
+            return None
+        data = fast_serializers.serialize(queryset, serializer)
+        return data[0] if data else None
+    
+    def my_cart_validators(self, user):
+        """
+        The cart's own updated_at (bumped on every line change) plus the
+        latest change to any product in it, read in one aggregate query
+        """
+        row = (
+            Cart.objects.filter(user_id=user.pk)
+            .annotate(item_count=Count('items'), products_updated_at=Max('items__product__updated_at'))
+            .values_list('updated_at', 'item_count', 'products_updated_at')
+            .first()
+        )
+        if row is None:
+            # No cart yet: the handler creates it
+            return None
+        return make_version(*row), latest(row[0], row[2])
     
     @action(detail=False, methods=['get'])
     def my_cart(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
+        return self.conditional_response(request, self.my_cart_validators(request.user), self._my_cart)
+    
+    def _my_cart(self, request):
+        data = self.fast_cart_data(Cart.objects.filter(user_id=request.user.pk), self.get_serializer())
+        if data is not None:
+            return Response(data)
+        columns = nested_columns(self.get_serializer(), 'items')
+        cart = Cart.objects.with_items(columns).filter(user_id=request.user.pk).first()
+        if cart is None:
+            # Only a real, active user gets a cart created (request.user may be
+            # a TokenUser, whose account can be gone)
+            user = request.user
+            if not isinstance(user, User):
+                user = request.successful_authenticator.get_user(request.auth)
+            cart, created = Cart.objects.with_items(columns).get_or_create(user=user)
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def add_item(self, request):
         product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity', 1)
+        quantity = parse_int(request.data.get('quantity', 1))
         
         if not product_id:
             return Response(
@@ -31,33 +101,26 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            product = Product.objects.get(id=product_id, is_active=True)
-        except Product.DoesNotExist:
+        product_id = parse_int(product_id)
+        if product_id is None:
             return Response(
-                {'error': 'Product not found'}, 
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'Product ID must be an integer'}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
         
-        if product.stock < quantity:
+        if quantity is None or quantity < 1:
             return Response(
-                {'error': 'Insufficient stock'}, 
+                {'error': 'Quantity must be a positive integer'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
         cart, created = Cart.objects.get_or_create(user=request.user)
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart, 
-            product=product,
-            defaults={'quantity': quantity}
-        )
-        
-        if not created:
-            cart_item.quantity += quantity
-            cart_item.save()
+        try:
+            operations.add_item(cart, product_id, quantity)
+        except operations.CartOperationError as exc:
+            return Response({'error': exc.message}, status=exc.status_code)
         
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.get_cart_data(cart))
     
     @action(detail=False, methods=['post'])
     def remove_item(self, request):
@@ -69,20 +132,57 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        product_id = parse_int(product_id)
+        if product_id is None:
+            return Response(
+                {'error': 'Product ID must be an integer'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
             cart = Cart.objects.get(user=request.user)
-            cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-            cart_item.delete()
-        except (Cart.DoesNotExist, CartItem.DoesNotExist):
+            operations.remove_item(cart, product_id)
+        except (Cart.DoesNotExist, operations.ItemNotFoundError):
             return Response(
                 {'error': 'Item not found in cart'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        return Response(self.get_cart_data(cart))
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Apply many add/remove/update operations in one request and one transaction
+        """
+        ops = request.data.get('operations')
+        
+        if not isinstance(ops, list) or not ops:
+            return Response(
+                {'error': 'operations must be a non-empty list'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(ops) > operations.MAX_BATCH_OPERATIONS:
+            return Response(
+                {'error': f'A batch can contain at most {operations.MAX_BATCH_OPERATIONS} operations'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        try:
+            results = operations.apply_batch(cart, ops)
+        except operations.CartOperationError as exc:
+            return Response({'error': exc.message}, status=exc.status_code)
+        
+        return Response({
+            'results': results,
+            'errors': sum(1 for result in results if 'error' in result),
+            'cart': self.get_cart_data(cart)
+        })
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def checkout(self, request):
         shipping_address = request.data.get('shipping_address')
         payment_method = request.data.get('payment_method')
@@ -108,52 +208,26 @@ class CartViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            cart = Cart.objects.get(user=request.user)
-            if cart.items.count() == 0:
-                return Response(
-                    {'error': 'Cart is empty'}, 
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Create order with automatic processing for demo
-            order = Order.objects.create(
-                user=request.user,
-                shipping_address=shipping_address,
-                payment_method=payment_method,
-                total_amount=cart.total_price,
-                status='processing'  # Automatically set to processing for demo
-            )
-            
-            # Create order items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    quantity=cart_item.quantity,
-                    price=cart_item.product.price
-                )
-                
-                # Update stock
-                product = cart_item.product
-                product.stock -= cart_item.quantity
-                product.save()
-            
-            # Clear cart
-            cart.items.all().delete()
-            
-            # Return success message with order details
-            serializer = OrderSerializer(order)
-            return Response({
-                'success': True,
-                'message': 'Pago procesado exitosamente. Su orden ha sido confirmada.',
-                'order': serializer.data
-            }, status=status.HTTP_201_CREATED)
-            
+            order = checkout_cart(request.user, shipping_address, payment_method)
         except Cart.DoesNotExist:
             return Response(
                 {'error': 'Cart not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        except CheckoutError as exc:
+            return Response(
+                {'error': exc.message, **exc.details}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Return success message with order details
+        order = Order.objects.with_items().get(pk=order.pk)
+        serializer = OrderSerializer(order)
+        return Response({
+            'success': True,
+            'message': 'Pago procesado exitosamente. Su orden ha sido confirmada.',
+            'order': serializer.data
+        }, status=status.HTTP_201_CREATED)
     
     def destroy(self, request, *args, **kwargs):
         """
@@ -168,7 +242,7 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        item_count = cart.items.count()
+        item_count = operations.clear(cart)
         self.perform_destroy(cart)
         
         return Response(
@@ -183,8 +257,7 @@ class CartViewSet(viewsets.ModelViewSet):
         """
         try:
             cart = Cart.objects.get(user=request.user)
-            item_count = cart.items.count()
-            cart.items.all().delete()
+            item_count = operations.clear(cart)
             
             return Response(
                 {'message': f'Cart cleared successfully. {item_count} items were removed.'}, 
@@ -202,7 +275,7 @@ class CartViewSet(viewsets.ModelViewSet):
         Update quantity of a specific item in cart
         """
         product_id = request.data.get('product_id')
-        quantity = request.data.get('quantity', 0)
+        quantity = parse_int(request.data.get('quantity', 0))
         
         if not product_id:
             return Response(
@@ -210,7 +283,14 @@ class CartViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if quantity < 0:
+        product_id = parse_int(product_id)
+        if product_id is None:
+            return Response(
+                {'error': 'Product ID must be an integer'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if quantity is None or quantity < 0:
             return Response(
                 {'error': 'Quantity cannot be negative'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -218,46 +298,85 @@ class CartViewSet(viewsets.ModelViewSet):
         
         try:
             cart = Cart.objects.get(user=request.user)
-            cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-            
-            if quantity == 0:
-                # Remove item if quantity is 0
-                cart_item.delete()
-                message = 'Item removed from cart'
-            else:
-                # Check stock availability
-                if cart_item.product.stock < quantity:
-                    return Response(
-                        {'error': 'Insufficient stock'}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                cart_item.quantity = quantity
-                cart_item.save()
-                message = 'Item quantity updated'
-            
-            serializer = CartSerializer(cart)
-            return Response({
-                'message': message,
-                'cart': serializer.data
-            })
-            
-        except (Cart.DoesNotExist, CartItem.DoesNotExist):
+            message = operations.set_item_quantity(cart, product_id, quantity)
+        except Cart.DoesNotExist:
             return Response(
                 {'error': 'Item not found in cart'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
+        except operations.CartOperationError as exc:
+            return Response({'error': exc.message}, status=exc.status_code)
+        
+        return Response({
+            'message': message,
+            'cart': self.get_cart_data(cart)
+        })
 
-class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderViewSet(ReplicaReadMixin, ConditionalGetMixin, FastListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        if self.request.user.is_staff:
-            return Order.objects.all()
-        return Order.objects.filter(user=self.request.user)
+        columns = None
+        if self.action in ('list', 'retrieve') and not self.use_fast_serialization():
+            # Only load the item columns the requested representation emits
+            columns = nested_columns(self.get_serializer(many=self.action == 'list'), 'items')
+        # Newest first, along the (created_at, id) indexes
+        queryset = Order.objects.order_by('-created_at', '-id')
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset.with_items(columns)
+    
+    # Orders embed their products (and, with ?expand=category, categories),
+    # so changes to those change the representation too
+    NESTED_TIMESTAMPS = ('items__product__updated_at', 'items__product__category__updated_at')
+    
+    def list(self, request, *args, **kwargs):
+        validators = list_validators(
+            self.filter_queryset(self.get_queryset()), 'updated_at', *self.NESTED_TIMESTAMPS
+        )
+        return self.conditional_response(request, validators, super().list, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.get_queryset().filter(pk=kwargs.get('pk')).annotate(
+            **{f'last_{i}': Max(field) for i, field in enumerate(self.NESTED_TIMESTAMPS)}
+        )
+        validators = row_validators(
+            queryset, 'updated_at', *[f'last_{i}' for i in range(len(self.NESTED_TIMESTAMPS))]
+        )
+        return self.conditional_response(request, validators, super().retrieve, *args, **kwargs)
+    
+    def stream_export(self, request, columns, get_queryset, filename):
+        file_format = requested_format(request)
+        if file_format is None:
+            return Response(
+                {'error': 'file_format must be csv or ndjson'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Staff export every order, customers only their own
+        user = None if request.user.is_staff else request.user
+        queryset = get_queryset(user=user, status=request.query_params.get('status'))
+        return streaming_export(queryset, columns, file_format, filename)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the order history as CSV or NDJSON (?file_format=, ?status=)
+        """
+        return self.stream_export(request, ORDER_COLUMNS, order_export_queryset, 'orders')
+    
+    @action(detail=False, methods=['get'])
+    def export_items(self, request):
+        """
+        Stream the order lines as CSV or NDJSON (?file_format=, ?status=)
+        """
+        return self.stream_export(request, ORDER_ITEM_COLUMNS, order_item_export_queryset, 'order_items')
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def cancel_order(self, request, pk=None):
         """
         Cancel an order if it's in a cancellable state
@@ -271,25 +390,17 @@ class OrderViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Check if order can be cancelled
-        cancellable_statuses = ['pending', 'processing']
-        if order.status not in cancellable_statuses:
+        # Check if order can be cancelled; the status is checked again by
+        # the cancelling UPDATE, in case it changed since it was read
+        if order.status not in CANCELLABLE_STATUSES or not cancel_order(order):
+            order.refresh_from_db(fields=['status'])
             return Response(
                 {'error': f'Cannot cancel order with status "{order.status}". Only orders with status "pending" or "processing" can be cancelled.'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Restore stock for cancelled orders
-        for order_item in order.items.all():
-            product = order_item.product
-            product.stock += order_item.quantity
-            product.save()
-        
-        # Update order status
-        order.status = 'cancelled'
-        order.save()
-        
-        serializer = self.get_serializer(order)
+        # Reloaded with the restored stock of its products
+        serializer = self.get_serializer(self.get_object())
         return Response({
             'message': f'Order #{order.id} has been cancelled successfully. Stock has been restored.',
             'order': serializer.data
@@ -1,4 +1,7 @@
+from django import forms
 from django.contrib import admin
+from django.db import transaction
+from cart.reservations import held_stock, on_hand, on_hand_error
 from .models import Product, Category
 
 @admin.register(Category)
@@ -7,9 +10,47 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name']
     list_filter = ['created_at']
 
+class ProductAdminForm(forms.ModelForm):
+    """
+    Edits stock as units on hand (Product.stock plus the units held by
+    carts), as update_stock and the bulk stock endpoints take it
+    """
+    class Meta:
+        model = Product
+        fields = '__all__'
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk and 'stock' in self.fields:
+            held = held_stock([self.instance.pk]).get(self.instance.pk, 0)
+            self.initial['stock'] = self.instance.stock + held
+    
+    def clean_stock(self):
+        stock = self.cleaned_data['stock']
+        if self.instance.pk and 'stock' in self.changed_data:
+            error = on_hand_error(self.instance.pk, stock)
+            if error:
+                raise forms.ValidationError(error)
+        return stock
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
     list_display = ['name', 'price', 'stock', 'category', 'is_active', 'created_at']
     list_filter = ['category', 'is_active', 'created_at']
     search_fields = ['name', 'description']
     list_editable = ['price', 'stock', 'is_active']
+    
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        if not form.changed_data:
+            return
+        # Only the edited fields, so a hold taken since the form was loaded
+        # is not overwritten; stock minus the holds in the same UPDATE
+        with transaction.atomic():
+            if 'stock' in form.changed_data:
+                obj.stock = on_hand(form.cleaned_data['stock'])
+            obj.save(update_fields=[*form.changed_data, 'updated_at'])
+        if 'stock' in form.changed_data:
+            obj.refresh_from_db(fields=['stock'])
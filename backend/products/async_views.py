@@ -0,0 +1,321 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.urls import path, re_path
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from tienda_backend import fast_serializers, routing
+from tienda_backend.authentication import CachedJWTAuthentication
+from tienda_backend.conditional import (
+    alist_validators, arow_validators, is_not_modified, latest, make_version, representation_etag,
+)
+from tienda_backend.pagination import KeysetPagination, apaginate_queryset
+
+from . import cache as catalog_cache
+from .models import Category
+from .search import search_products
+from .serializers import CategorySerializer, ProductSerializer
+from .views import CategoryViewSet, ProductViewSet
+
+# Same data and headers as the viewsets: only JSON is served here, the
+# browsable API and every other method go to the viewset itself
+JSON_FORMAT = 'json'
+LOOKUP_ERRORS = (TypeError, ValueError, ValidationError)
+
+_jwt = CachedJWTAuthentication()
+_negotiator = DefaultContentNegotiation()
+
+
+class Fallback(Exception):
+    """
+    The request needs something only the sync viewset does
+    """
+
+
+class CatalogRead:
+    """
+    What a handler gets: the DRF request (for query_params, links and
+    serializer context) and the viewset action it stands in for
+    """
+
+    def __init__(self, request, action, renderer, media_type):
+        self.request = request
+        self.action = action
+        self.renderer = renderer
+        self.media_type = media_type
+
+    def get_plan(self, serializer_class, many):
+        serializer = serializer_class(many=many, context={'request': self.request, 'view': self})
+        plan = fast_serializers.get_plan(serializer)
+        if plan is None or plan.children:
+            # Many relations are read with sync queries
+            raise Fallback
+        return plan
+
+    def render(self, data, status_code=status.HTTP_200_OK):
+        if data is None:
+            # Like DRF's Response, an empty body has no Content-Type
+            response = HttpResponse(status=status_code)
+            del response['Content-Type']
+            return response
+        content = self.renderer.render(data, self.media_type, {})
+        return HttpResponse(content, status=status_code, content_type=self.renderer.media_type)
+
+
+async def authenticate(request):
+    """
+    The user as the viewsets' authentication classes see it: JWT, then the
+    session. A bad token raises AuthenticationFailed, as it does there.
+    """
+    if _jwt.get_header(request) is not None:
+        user_auth = await sync_to_async(_jwt.authenticate)(request)
+        if user_auth is not None:
+            return user_auth[0]
+    auser = getattr(request, 'auser', None)
+    return await auser() if auser is not None else None
+
+
+def error_data(exc):
+    if isinstance(exc.detail, (list, dict)):
+        return exc.detail
+    return {'detail': exc.detail}
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+async def cached_read(read, key, get_validators, handler):
+    """
+    CatalogCacheMixin.cached_response() for async handlers, sharing its
+    cache entries and validators; handler() returns (status, data)
+    """
+    cache = catalog_cache.get_cache()
+    entry = await cache.aget(key)
+    if entry is None:
+        catalog_cache.read_primary_after_change(await cache.aget(catalog_cache.CHANGED_KEY))
+        try:
+            validators = await get_validators()
+        except LOOKUP_ERRORS:
+            validators = None
+        if validators is None:
+            return read.render(*reversed(await handler()))
+
+        version, last_modified = validators
+        etag = representation_etag(version, JSON_FORMAT)
+        if is_not_modified(read.request, etag, last_modified):
+            return set_validators(read.render(None, status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+        fresh = {}
+
+        async def compute():
+            status_code, data = fresh['result'] = await handler()
+            if status_code != status.HTTP_200_OK:
+                return None
+            return {'version': version, 'last_modified': last_modified, 'data': data}
+
+        entry = await catalog_cache.aget_or_compute(key, compute)
+        if 'result' in fresh:
+            status_code, data = fresh['result']
+            response = read.render(data, status_code)
+            if status_code == status.HTTP_200_OK:
+                set_validators(response, etag, last_modified)
+            return response
+
+    etag = representation_etag(entry['version'], JSON_FORMAT)
+    if is_not_modified(read.request, etag, entry['last_modified']):
+        return set_validators(read.render(None, status.HTTP_304_NOT_MODIFIED), etag, entry['last_modified'])
+    return set_validators(read.render(entry['data']), etag, entry['last_modified'])
+
+
+async def list_data(read, plan, queryset, paginator):
+    """
+    Serialized rows of a list action, paginated as the viewset does
+    """
+    request = read.request
+    extra = ['id']
+    timestamp_field = getattr(paginator, 'timestamp_field', None)
+    if timestamp_field:
+        extra.append(timestamp_field)
+    rows = plan.values(queryset, *extra)
+    if isinstance(paginator, KeysetPagination):
+        page = await paginator.apaginate_queryset(rows, request, read)
+    else:
+        page = await apaginate_queryset(paginator, rows, request)
+    if page is None:
+        return plan.build([row async for row in rows], request)
+    return paginator.get_paginated_response(plan.build(page, request)).data
+
+
+def active_products(request):
+    # ProductViewSet.get_queryset(), less the column pruning of the sync path
+    return ProductViewSet.active_products(request.query_params.get('category', None))
+
+
+async def product_list(read):
+    request = read.request
+    key = catalog_cache.request_key('products', await catalog_cache.aget_version('listing'), request)
+    queryset = active_products(request)
+    plan = read.get_plan(ProductSerializer, many=True)
+
+    async def handler():
+        return status.HTTP_200_OK, await list_data(read, plan, queryset, ProductViewSet.pagination_class())
+
+    return await cached_read(
+        read, key, lambda: alist_validators(queryset, 'updated_at', 'category__updated_at'), handler,
+    )
+
+
+async def product_detail(read, pk):
+    request = read.request
+    key = catalog_cache.request_key(f'product:{pk}', await catalog_cache.aget_version(f'product:{pk}'), request)
+    plan = read.get_plan(ProductSerializer, many=False)
+
+    async def handler():
+        try:
+            queryset = active_products(request).filter(pk=pk)
+        except LOOKUP_ERRORS:
+            raise exceptions.NotFound()
+        row = await plan.values(queryset).afirst()
+        if row is None:
+            raise exceptions.NotFound('No Product matches the given query.')
+        return status.HTTP_200_OK, plan.build([row], request)[0]
+
+    return await cached_read(
+        read, key,
+        lambda: arow_validators(active_products(request).filter(pk=pk), 'updated_at', 'category__updated_at'),
+        handler,
+    )
+
+
+async def product_search(read):
+    request = read.request
+    plan = read.get_plan(ProductSerializer, many=True)
+    products = search_products(request.query_params.get('q', ''), ProductViewSet.active_products())
+    return read.render(await list_data(read, plan, products, ProductViewSet.pagination_class()))
+
+
+async def category_list(read):
+    request = read.request
+    key = catalog_cache.request_key('categories', await catalog_cache.aget_version('listing'), request)
+    queryset = CategoryViewSet.queryset.all()
+    plan = read.get_plan(CategorySerializer, many=True)
+
+    async def handler():
+        return status.HTTP_200_OK, await list_data(read, plan, queryset, CategoryViewSet.pagination_class())
+
+    return await cached_read(read, key, lambda: alist_validators(queryset, 'updated_at'), handler)
+
+
+async def category_products(read, pk):
+    request = read.request
+    key = catalog_cache.request_key(f'category:{pk}', await catalog_cache.aget_version(f'category:{pk}'), request)
+    plan = read.get_plan(ProductSerializer, many=True)
+
+    async def get_validators():
+        category_validators = await arow_validators(Category.objects.filter(pk=pk), 'updated_at')
+        if category_validators is None:
+            return None
+        version, category_updated = category_validators
+        products_version, products_updated = await alist_validators(
+            CategoryViewSet.category_products(pk), 'updated_at'
+        )
+        return make_version(version, products_version), latest(category_updated, products_updated)
+
+    async def handler():
+        try:
+            exists = await Category.objects.filter(pk=pk).aexists()
+        except LOOKUP_ERRORS:
+            raise exceptions.NotFound()
+        if not exists:
+            raise exceptions.NotFound('No Category matches the given query.')
+        products = CategoryViewSet.category_products(pk)
+        return status.HTTP_200_OK, plan.build([row async for row in plan.values(products)], request)
+
+    return await cached_read(read, key, get_validators, handler)
+
+
+def catalog_view(handler, viewset, actions, **initkwargs):
+    """
+    Async view for one catalog route: JSON GET/HEAD requests run handler
+    natively, everything else runs the viewset (in a thread, as Django
+    runs any sync view under ASGI)
+    """
+    sync_view = viewset.as_view(actions, **initkwargs)
+    action = actions['get']
+    # The Allow header of the viewset route
+    methods = {*actions, 'options', *(('head',) if 'get' in actions else ())}
+    allow = ', '.join(method.upper() for method in viewset.http_method_names if method in methods)
+
+    async def view(request, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(sync_view)(request, **kwargs)
+
+        drf_request = Request(request)
+        renderers = [renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+        try:
+            renderer, media_type = _negotiator.select_renderer(drf_request, renderers)
+        except exceptions.NotAcceptable:
+            renderer = None
+        if renderer is None or renderer.format != JSON_FORMAT:
+            return await sync_to_async(sync_view)(request, **kwargs)
+
+        read = CatalogRead(drf_request, action, renderer, media_type)
+        try:
+            user = await authenticate(request)
+            if routing.get_replicas() and not await routing.ais_pinned(user):
+                routing.use_replica()
+            response = await handler(read, **kwargs)
+        except Fallback:
+            return await sync_to_async(sync_view)(request, **kwargs)
+        except exceptions.APIException as exc:
+            response = read.render(error_data(exc), exc.status_code)
+            if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                response['WWW-Authenticate'] = _jwt.authenticate_header(request)
+        response['Vary'] = 'Accept'
+        response['Allow'] = allow
+        return response
+
+    return csrf_exempt(view)
+
+
+def detail_route(viewset, prefix, suffix=''):
+    """
+    Detail URL regex of a viewset that, like the router's order of routes,
+    leaves its list-level actions (products/export/...) to the viewset
+    """
+    actions = [re.escape(action.url_path) for action in viewset.get_extra_actions() if not action.detail]
+    exclude = rf'(?!(?:{"|".join(actions)})/$)' if actions else ''
+    return rf'^{prefix}/{exclude}(?P<pk>[^/.]+)/{suffix}$'
+
+
+# Mounted in front of the API routes by tienda_backend.asgi_urls
+urlpatterns = [
+    path('products/', catalog_view(
+        product_list, ProductViewSet, {'get': 'list', 'post': 'create'}, basename='product', detail=False,
+    )),
+    path('products/search/', catalog_view(
+        product_search, ProductViewSet, {'get': 'search'}, basename='product', detail=False,
+    )),
+    re_path(detail_route(ProductViewSet, 'products'), catalog_view(
+        product_detail, ProductViewSet,
+        {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+        basename='product', detail=True,
+    )),
+    path('categories/', catalog_view(
+        category_list, CategoryViewSet, {'get': 'list', 'post': 'create'}, basename='category', detail=False,
+    )),
+    re_path(detail_route(CategoryViewSet, 'categories', 'products/'), catalog_view(
+        category_products, CategoryViewSet, {'get': 'products'}, basename='category', detail=True,
+    )),
+]
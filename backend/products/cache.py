@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework.response import Response
+
+from tienda_backend import routing
+from tienda_backend.conditional import ConditionalGetMixin, is_not_modified
+
+# Keys are versioned instead of deleted: bumping a version makes every key
+# built with the old one unreachable, and those entries simply age out.
+#   product:<id>   one product's detail
+#   category:<id>  one category and the products listed under it
+#   listing        every list endpoint (products, categories)
+VERSION_PREFIX = 'catalog:version:'
+# When the catalog last changed, so misses right after a change are not
+# filled from a replica that may not have it yet
+CHANGED_KEY = 'catalog:changed'
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+
+_MISSING = object()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+def get_version(name):
+    cache = get_cache()
+    key = VERSION_PREFIX + name
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1, so a version evicted from the
+        # cache never comes back with a value that old entries were built with
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(name):
+    cache = get_cache()
+    key = VERSION_PREFIX + name
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump(*names, changed=True):
+    """
+    Bump the versions of names; changed also marks the catalog as just
+    changed (see read_primary_after_change())
+    """
+    cache = get_cache()
+    if changed:
+        cache.set(CHANGED_KEY, time.time(), None)
+    for name in names:
+        key = VERSION_PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def invalidate_products(product_ids=(), category_ids=()):
+    """
+    Invalidate the given products, the given categories and every listing
+    """
+    bump(
+        'listing',
+        *[f'product:{product_id}' for product_id in set(product_ids)],
+        *[f'category:{category_id}' for category_id in set(category_ids) if category_id is not None],
+    )
+
+
+def invalidate_stock(product_ids):
+    """
+    Invalidate the details and category listings of products whose stock a
+    set-based write changed (holds, checkouts, cancellations). These run on
+    every cart change, so they leave the global listings (which show stock
+    as of their last catalog edit, for at most CATALOG_CACHE_TIMEOUT) and
+    the replica reads alone. Runs once the transaction commits, so a miss in
+    between cannot cache the old stock under the new versions.
+    """
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+
+    def invalidate():
+        from .models import Product
+        category_ids = set(Product.objects.filter(id__in=product_ids).values_list('category_id', flat=True))
+        bump(
+            *[f'product:{product_id}' for product_id in product_ids],
+            *[f'category:{category_id}' for category_id in category_ids],
+            changed=False,
+        )
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_category(category_id):
+    """
+    Invalidate a category, every listing and the details of its products,
+    which embed the category
+    """
+    from .models import Product
+    product_ids = Product.objects.filter(category_id=category_id).values_list('id', flat=True)
+    bump('listing', f'category:{category_id}', *[f'product:{product_id}' for product_id in product_ids])
+
+
+def request_key(kind, version, request):
+    """
+    Cache key for a GET request; the host is part of it because paginated
+    responses carry absolute next/previous links
+    """
+    fingerprint = hashlib.md5(
+        f'{request.get_host()}{request.get_full_path()}'.encode('utf-8')
+    ).hexdigest()
+    return f'catalog:{kind}:{version}:{fingerprint}'
+
+
+def get_or_compute(key, compute):
+    """
+    Read-through lookup with single-flight protection: on a miss only the
+    caller that wins the lock runs compute(), the others wait for its result
+    (and compute it themselves only if it does not show up in time).
+    compute() may return None for values that must not be cached.
+    """
+    cache = get_cache()
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, get_timeout())
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if cache.get(lock_key) is None:
+            break
+    return compute()
+
+
+async def aget_or_compute(key, compute):
+    """
+    get_or_compute() for async views; compute is a coroutine function
+    """
+    cache = get_cache()
+    value = await cache.aget(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    lock_key = f'{key}:lock'
+    if await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = await compute()
+            if value is not None:
+                await cache.aset(key, value, get_timeout())
+            return value
+        finally:
+            await cache.adelete(lock_key)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(WAIT_INTERVAL)
+        value = await cache.aget(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if await cache.aget(lock_key) is None:
+            break
+    return await compute()
+
+
+def read_primary_after_change(changed):
+    """
+    Fill misses from the primary for a while after a catalog change
+    (changed is the CHANGED_KEY value): a replica may not have it yet
+    """
+    if changed is not None and time.time() - changed < routing.get_pin_seconds():
+        routing.use_primary()
+
+
+class CatalogCacheMixin(ConditionalGetMixin):
+    """
+    Serve read-only viewset responses from the catalog cache, with
+    ETag / Last-Modified validators stored alongside the cached data
+    """
+
+    def cached_response(self, request, key, get_validators, handler, *args, **kwargs):
+        """
+        get_validators() returns (version, last_modified), or None when the
+        resource does not exist; it only runs on a cache miss
+        """
+        entry = get_cache().get(key)
+        if entry is None:
+            read_primary_after_change(get_cache().get(CHANGED_KEY))
+            try:
+                validators = get_validators()
+            except (TypeError, ValueError, ValidationError):
+                # Malformed lookup value: let the handler answer with its usual 404
+                validators = None
+            if validators is None:
+                return handler(request, *args, **kwargs)
+
+            version, last_modified = validators
+            etag = self.get_etag(request, version)
+            if is_not_modified(request, etag, last_modified):
+                return self.not_modified(etag, last_modified)
+
+            fresh = {}
+
+            def compute():
+                response = handler(request, *args, **kwargs)
+                fresh['response'] = response
+                if response.status_code != 200:
+                    return None
+                return {'version': version, 'last_modified': last_modified, 'data': response.data}
+
+            entry = get_or_compute(key, compute)
+            if 'response' in fresh:
+                response = fresh['response']
+                if response.status_code == 200:
+                    self.set_validators(response, etag, last_modified)
+                return response
+
+        etag = self.get_etag(request, entry['version'])
+        if is_not_modified(request, etag, entry['last_modified']):
+            return self.not_modified(etag, entry['last_modified'])
+        return self.set_validators(Response(entry['data']), etag, entry['last_modified'])
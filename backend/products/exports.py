@@ -0,0 +1,31 @@
+from django.db.models import F
+
+from cart.reservations import held_units
+
+from .models import Product
+
+# (header, lookup) pairs; the header names match what import_products reads,
+# so an export can be fed back into an import. stock is the units on hand
+# (held units included), as imports and update_stock take it.
+PRODUCT_COLUMNS = [
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('price', 'price'),
+    ('stock', 'stock_on_hand'),
+    ('category_id', 'category_id'),
+    ('category', 'category__name'),
+    ('image', 'image'),
+    ('is_active', 'is_active'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+
+def product_export_queryset(category=None, active=None):
+    queryset = Product.objects.annotate(stock_on_hand=F('stock') + held_units()).order_by('id')
+    if category:
+        queryset = queryset.filter(category_id=category)
+    if active is not None:
+        queryset = queryset.filter(is_active=active)
+    return queryset
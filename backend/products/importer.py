@@ -0,0 +1,408 @@
+import codecs
+import csv
+import json
+import time
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+
+from cart.models import StockReservation
+from cart.reservations import held_stock
+from tienda_backend.parsing import parse_int
+
+from .models import Category, Product
+from . import cache as catalog_cache
+from . import search
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+_NAME_MAX_LENGTH = Product._meta.get_field('name').max_length
+_PRICE_MAX_DIGITS = Product._meta.get_field('price').max_digits
+_PRICE_DECIMAL_PLACES = Product._meta.get_field('price').decimal_places
+
+_TRUE = {'1', 'true', 'yes', 'y', 'si', 'sí'}
+_FALSE = {'0', 'false', 'no', 'n'}
+
+
+class ImportFormatError(Exception):
+    """
+    Raised when the file format is unknown or cannot be detected
+    """
+    pass
+
+
+class RowError(Exception):
+    pass
+
+
+def detect_format(filename, content_type=None):
+    """
+    Guess the format from the file extension, then from the content type
+    """
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+        return 'ndjson'
+    raise ImportFormatError(f'Unknown file format, expected one of: {", ".join(FORMATS)}')
+
+
+def read_rows(lines, file_format):
+    """
+    Yield (line number, row dict or None, error or None) from an iterable of
+    byte lines (an open file, an upload), decoding as it goes so the file is
+    never held in memory
+    """
+    text = codecs.iterdecode(lines, 'utf-8-sig')
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        try:
+            for row in reader:
+                yield reader.line_num, row, None
+        except (csv.Error, UnicodeDecodeError) as exc:
+            yield reader.line_num, None, f'Unreadable CSV: {exc}'
+        return
+
+    if file_format != 'ndjson':
+        raise ImportFormatError(f'Unknown file format, expected one of: {", ".join(FORMATS)}')
+    line_number = 0
+    try:
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f'Invalid JSON: {exc}'
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, 'Each line must be a JSON object'
+                continue
+            yield line_number, row, None
+    except UnicodeDecodeError as exc:
+        yield line_number + 1, None, f'Invalid UTF-8: {exc}'
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _integer(value, field):
+    number = parse_int(value)
+    if number is None:
+        raise RowError(f'{field} must be an integer')
+    return number
+
+
+def _boolean(value, field):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise RowError(f'{field} must be a boolean')
+
+
+def _price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise RowError('price must be a decimal number')
+    if not price.is_finite() or price < 0:
+        raise RowError('price must be a positive decimal number')
+    if price.as_tuple().exponent < -_PRICE_DECIMAL_PLACES:
+        raise RowError(f'price allows at most {_PRICE_DECIMAL_PLACES} decimal places')
+    if price >= Decimal(10) ** (_PRICE_MAX_DIGITS - _PRICE_DECIMAL_PLACES):
+        raise RowError('price is too large')
+    return price.quantize(Decimal(1).scaleb(-_PRICE_DECIMAL_PLACES))
+
+
+def clean_row(row):
+    """
+    Validate one input row and return the product values it describes.
+    Rows with an id update that product and only carry the columns given
+    (a blank cell counts as not given, except for the description); rows
+    without one create a product, optional columns taking their defaults.
+    The category is returned as given (category_id or category name) and
+    resolved later against the category map.
+    """
+    values = {}
+    if not _blank(row.get('id')):
+        values['id'] = _integer(row['id'], 'id')
+    creating = 'id' not in values
+
+    name = row.get('name')
+    if not _blank(name):
+        name = str(name).strip()
+        if len(name) > _NAME_MAX_LENGTH:
+            raise RowError(f'name must be at most {_NAME_MAX_LENGTH} characters')
+        values['name'] = name
+    elif creating:
+        raise RowError('name is required')
+
+    if 'description' in row or creating:
+        description = row.get('description')
+        values['description'] = '' if description is None else str(description)
+
+    if not _blank(row.get('price')):
+        values['price'] = _price(row['price'])
+    elif creating:
+        raise RowError('price is required')
+
+    if not _blank(row.get('stock')):
+        stock = _integer(row['stock'], 'stock')
+        if stock < 0:
+            raise RowError('stock cannot be negative')
+        values['stock'] = stock
+    elif creating:
+        values['stock'] = 0
+
+    if not _blank(row.get('is_active')):
+        values['is_active'] = _boolean(row['is_active'], 'is_active')
+    elif creating:
+        values['is_active'] = True
+
+    if not _blank(row.get('category_id')):
+        values['category'] = _integer(row['category_id'], 'category_id')
+    elif not _blank(row.get('category')):
+        values['category'] = str(row['category']).strip()
+    elif creating:
+        raise RowError('category or category_id is required')
+    return values
+
+
+def _update_products(products, names):
+    """
+    Write the fields in names (plus updated_at) of existing products with
+    one executemany UPDATE. QuerySet.bulk_update builds a CASE per column
+    and row, and compiling those expressions costs far more than the
+    statement itself. stock is written as units on hand: the units held by
+    carts are subtracted in the statement, as Product.stock excludes them.
+    """
+    if not products:
+        return
+    connection = connections[router.db_for_write(Product)]
+    quote = connection.ops.quote_name
+    table = quote(Product._meta.db_table)
+    pk = quote(Product._meta.pk.column)
+    fields = [Product._meta.get_field(name) for name in [*names, 'updated_at']]
+    held = (
+        f'COALESCE((SELECT SUM({quote("quantity")}) FROM {quote(StockReservation._meta.db_table)}'
+        f' WHERE {quote("product_id")} = {table}.{pk}), 0)'
+    )
+    assignments = ', '.join(
+        f'{quote(field.column)} = %s - {held}' if field.name == 'stock' else f'{quote(field.column)} = %s'
+        for field in fields
+    )
+    sql = f'UPDATE {table} SET {assignments} WHERE {pk} = %s'
+    params = [
+        [field.get_db_prep_save(getattr(product, field.attname), connection) for field in fields] + [product.pk]
+        for product in products
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+class CategoryMap:
+    """
+    Every category id and (case-insensitive) name, loaded once per import
+    so rows never look their category up one by one
+    """
+
+    def __init__(self, create_missing=False):
+        self.create_missing = create_missing
+        self.load()
+
+    def load(self):
+        self.ids = set()
+        self.by_name = {}
+        for category_id, name in Category.objects.values_list('id', 'name').iterator():
+            self.ids.add(category_id)
+            self.by_name.setdefault(name.strip().lower(), category_id)
+
+    def missing(self, references):
+        names = {}
+        for reference in references:
+            if isinstance(reference, str) and reference.lower() not in self.by_name:
+                names.setdefault(reference.lower(), reference)
+        return list(names.values())
+
+    def create(self, names):
+        created = Category.objects.bulk_create([Category(name=name) for name in names])
+        for category in created:
+            self.ids.add(category.id)
+            self.by_name[category.name.lower()] = category.id
+        return created
+
+    def resolve(self, reference):
+        if isinstance(reference, int):
+            if reference not in self.ids:
+                raise RowError(f'Category {reference} does not exist')
+            return reference
+        category_id = self.by_name.get(reference.lower())
+        if category_id is None:
+            raise RowError(f'Category "{reference}" does not exist')
+        return category_id
+
+
+class ImportResult:
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': message})
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed) if self.elapsed else self.rows
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.error_count,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+            'errors': self.errors,
+            'errors_truncated': self.error_count > len(self.errors),
+        }
+
+
+def _write_batch(batch, categories, result):
+    """
+    Write one batch of cleaned rows in a single transaction: one bulk_create
+    for new products, one executemany UPDATE per set of given columns for
+    existing ones, plus their search index entries. Returns (created,
+    updated, product ids, category ids), the ids being what the catalog
+    cache has to drop.
+    """
+    if categories.create_missing:
+        missing = categories.missing(values['category'] for _, values in batch if 'category' in values)
+        if missing:
+            categories.create(missing)
+
+    rows = {}
+    for line, values in batch:
+        if 'category' in values:
+            try:
+                values['category_id'] = categories.resolve(values.pop('category'))
+            except RowError as exc:
+                result.add_error(line, str(exc))
+                continue
+        if 'id' in values:
+            # The same id twice in one batch: later columns win
+            previous = rows.get(values['id'], (line, {}))[1]
+            rows[values['id']] = (line, {**previous, **values})
+        else:
+            rows[('new', line)] = (line, values)
+
+    update_ids = [values['id'] for line, values in rows.values() if 'id' in values]
+    previous_categories = dict(
+        Product.objects.filter(id__in=update_ids).values_list('id', 'category_id')
+    )
+    held = held_stock([values['id'] for line, values in rows.values() if 'stock' in values and 'id' in values])
+
+    now = timezone.now()
+    to_create = []
+    to_update = defaultdict(list)
+    for line, values in rows.values():
+        product_id = values.get('id')
+        if product_id is None:
+            to_create.append(Product(**values))
+        elif product_id not in previous_categories:
+            result.add_error(line, f'Product {product_id} does not exist')
+        elif 'stock' in values and values['stock'] < held.get(product_id, 0):
+            result.add_error(line, f'{held[product_id]} units are held in carts, stock cannot be set below that')
+        else:
+            names = tuple(sorted(name for name in values if name != 'id'))
+            to_update[names].append(Product(updated_at=now, **values))
+
+    Product.objects.bulk_create(to_create)
+    reindex = []
+    for names, products in to_update.items():
+        _update_products(products, names)
+        if {'name', 'description', 'is_active'} & set(names):
+            reindex.extend(product.id for product in products)
+    search.index_products(to_create)
+    if reindex:
+        # Updated rows only carry the given columns: index what was stored
+        search.index_products(Product.objects.filter(id__in=reindex).only('name', 'description', 'is_active'))
+
+    updated = [product for products in to_update.values() for product in products]
+    category_ids = {product.category_id for product in to_create + updated if product.category_id is not None}
+    category_ids.update(previous_categories.values())
+    return len(to_create), len(updated), [product.id for product in updated], category_ids
+
+
+def import_products(lines, file_format, batch_size=DEFAULT_BATCH_SIZE, create_categories=False,
+                    max_errors=MAX_REPORTED_ERRORS):
+    """
+    Create or update products from a CSV or NDJSON stream.
+
+    Rows with an id update the columns they give of that product, rows
+    without one create a new product. Stock is units on hand (the units
+    held by carts are left out of Product.stock). The category is given as
+    category_id or as a category name (optionally created when unknown).
+    Rows are validated as they are read and written in batches of batch_size, each batch in its own transaction,
+    so a bad row is reported and skipped without losing the rest.
+    Returns an ImportResult.
+    """
+    result = ImportResult(max_errors)
+    categories = CategoryMap(create_missing=create_categories)
+
+    def flush(batch):
+        try:
+            with transaction.atomic():
+                created, updated, product_ids, category_ids = _write_batch(batch, categories, result)
+        except DatabaseError as exc:
+            for line, _ in batch:
+                result.add_error(line, f'Batch rejected by the database: {exc}')
+            # Categories created by the rolled back batch are gone
+            categories.load()
+            return
+        result.created += created
+        result.updated += updated
+        catalog_cache.invalidate_products(product_ids, category_ids)
+
+    batch = []
+    for line, row, error in read_rows(lines, file_format):
+        result.rows += 1
+        if error is None:
+            try:
+                batch.append((line, clean_row(row)))
+            except RowError as exc:
+                error = str(exc)
+        if error is not None:
+            result.add_error(line, error)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return result.finish()
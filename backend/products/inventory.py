@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from cart.reservations import held_units, on_hand
+from tienda_backend.parsing import parse_int
+
+from .models import Product
+from . import cache as catalog_cache
+
+MAX_STOCK_UPDATES = 10000
+# Products per UPDATE statement, to stay well below the bound parameter limits
+CHUNK_SIZE = 500
+
+
+class StockConflict(Exception):
+    """
+    Raised when stock moved between reading and writing a chunk
+    """
+    pass
+
+
+def parse_updates(updates):
+    """
+    Validate [{'id', 'stock'} or {'id', 'delta'}] entries.
+    Returns ({id: ('stock' | 'delta', value)}, [error results]).
+    """
+    parsed = {}
+    errors = []
+    for index, update in enumerate(updates):
+        product_id = parse_int(update.get('id')) if isinstance(update, dict) else None
+        if product_id is None:
+            errors.append({'index': index, 'error': 'id is required'})
+            continue
+        if product_id in parsed:
+            errors.append({'id': product_id, 'error': 'Duplicate id'})
+            continue
+        if ('stock' in update) == ('delta' in update):
+            errors.append({'id': product_id, 'error': 'Give either stock or delta'})
+            continue
+        mode = 'stock' if 'stock' in update else 'delta'
+        value = parse_int(update[mode])
+        if value is None:
+            errors.append({'id': product_id, 'error': f'{mode} must be an integer'})
+            continue
+        if mode == 'stock' and value < 0:
+            errors.append({'id': product_id, 'error': 'Quantity cannot be negative'})
+            continue
+        parsed[product_id] = (mode, value)
+    return parsed, errors
+
+
+def _apply_chunk(chunk):
+    """
+    Apply one chunk with a locked read and a single CASE UPDATE.
+    Returns (results, category ids).
+    """
+    # Absolute values are units on hand: the units held by carts stay out of
+    # Product.stock (they come back when the holds are released)
+    current = {}
+    held = {}
+    rows = (
+        Product.objects.select_for_update().filter(id__in=chunk)
+        .annotate(held=held_units()).values_list('id', 'stock', 'category_id', 'held')
+    )
+    for product_id, stock, category_id, units in rows:
+        current[product_id] = (stock, category_id)
+        held[product_id] = units
+
+    results = []
+    whens = []
+    minimums = []
+    for product_id, (mode, value) in chunk.items():
+        if product_id not in current:
+            results.append({'id': product_id, 'error': 'Product not found'})
+            continue
+        stock = current[product_id][0]
+        if mode == 'stock' and value < held[product_id]:
+            results.append({
+                'id': product_id,
+                'error': f'{held[product_id]} units are held in carts, stock cannot be set below that',
+            })
+            continue
+        new_stock = value - held[product_id] if mode == 'stock' else stock + value
+        if new_stock < 0:
+            results.append({'id': product_id, 'error': 'Insufficient stock'})
+            continue
+        if mode == 'stock':
+            whens.append(When(id=product_id, then=on_hand(value)))
+        else:
+            whens.append(When(id=product_id, then=F('stock') + value))
+            if value < 0:
+                minimums.append(When(id=product_id, then=Value(-value)))
+        results.append({'id': product_id, 'stock': new_stock})
+
+    applied = [result['id'] for result in results if 'stock' in result]
+    if applied:
+        # Guard deltas in the statement itself, as select_for_update is a
+        # no-op on SQLite: anything less than a full match means a conflict
+        updated = Product.objects.filter(
+            id__in=applied,
+            stock__gte=Case(*minimums, default=Value(0), output_field=IntegerField()),
+        ).update(
+            stock=Case(*whens, output_field=IntegerField()),
+            updated_at=Now(),
+        )
+        if updated != len(applied):
+            raise StockConflict('Stock changed while applying the update, please retry')
+    return results, {current[product_id][1] for product_id in applied}
+
+
+def apply_stock_updates(updates):
+    """
+    Set (stock: units on hand, holds included) or adjust (delta) the stock
+    of many products in one transaction, CHUNK_SIZE products per UPDATE
+    statement. Entries that cannot be applied (unknown product, stock going
+    negative) are reported and skipped. Returns one compact result per entry.
+    """
+    parsed, results = parse_updates(updates)
+    ids = list(parsed)
+    category_ids = set()
+    with transaction.atomic():
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = {product_id: parsed[product_id] for product_id in ids[start:start + CHUNK_SIZE]}
+            chunk_results, chunk_categories = _apply_chunk(chunk)
+            results.extend(chunk_results)
+            category_ids |= chunk_categories
+
+    catalog_cache.invalidate_products(
+        [result['id'] for result in results if 'stock' in result], category_ids
+    )
+    return results
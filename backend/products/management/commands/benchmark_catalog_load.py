@@ -0,0 +1,176 @@
+import asyncio
+import io
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+
+from products.models import Category, Product
+
+# The URL configuration each deployment serves (see settings.ASYNC_CATALOG)
+SERVERS = {
+    'wsgi': 'tienda_backend.urls',
+    'asgi': 'tienda_backend.asgi_urls',
+}
+
+HOST = 'localhost'
+
+
+def percentile(durations, fraction):
+    if not durations:
+        return 0.0
+    durations = sorted(durations)
+    return durations[min(len(durations) - 1, int(len(durations) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load the catalog read endpoints through Django\'s WSGI handler (a thread '
+        'per concurrent client) and its ASGI handler (a task per client), in '
+        'process and against the configured database, and report throughput and latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration per server')
+        parser.add_argument('--server', choices=sorted(SERVERS), action='append', help='Default: both')
+        parser.add_argument('--path', action='append', help='URL to request (repeatable); default: catalog reads')
+        parser.add_argument(
+            '--cached', action='store_true',
+            help='Serve from the catalog cache; by default every response is computed',
+        )
+
+    def handle(self, *args, **options):
+        urls = [urlsplit(url) for url in options['path'] or self.default_paths()]
+        overrides = {'DEBUG': False}
+        if not options['cached']:
+            overrides['CATALOG_CACHE_TIMEOUT'] = 0
+
+        self.stdout.write(
+            f'{"server":<8}{"requests":>10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}'
+        )
+        for server in options['server'] or SERVERS:
+            with override_settings(ROOT_URLCONF=SERVERS[server], **overrides):
+                if server == 'asgi':
+                    durations, errors = asyncio.run(self.load_asgi(urls, options))
+                else:
+                    durations, errors = self.load_wsgi(urls, options)
+            rate = len(durations) / options['seconds']
+            self.stdout.write(
+                f'{server:<8}{len(durations):>10}{rate:>10.0f}'
+                f'{percentile(durations, 0.5) * 1000:>10.1f}{percentile(durations, 0.99) * 1000:>10.1f}'
+                f'{errors:>8}'
+            )
+        connections.close_all()
+
+    def default_paths(self):
+        paths = ['/api/products/', '/api/categories/', '/api/products/search/?q=a']
+        product = Product.objects.filter(is_active=True).values_list('id', flat=True).first()
+        if product is not None:
+            paths.append(f'/api/products/{product}/')
+        category = Category.objects.values_list('id', flat=True).first()
+        if category is not None:
+            paths.append(f'/api/categories/{category}/products/')
+        return paths
+
+    def load_wsgi(self, urls, options):
+        handler = WSGIHandler()
+        deadline = time.monotonic() + options['seconds']
+        results = [([], [0]) for _ in range(options['concurrency'])]
+
+        def client(durations, errors):
+            try:
+                while time.monotonic() < deadline:
+                    url = urls[len(durations) % len(urls)]
+                    status = []
+                    start = time.perf_counter()
+                    response = handler(self.environ(url), lambda code, headers: status.append(code))
+                    try:
+                        b''.join(response)
+                    finally:
+                        response.close()
+                    durations.append(time.perf_counter() - start)
+                    if not status[0].startswith(('2', '3')):
+                        errors[0] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=client, args=result) for result in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [d for durations, _ in results for d in durations], sum(errors[0] for _, errors in results)
+
+    async def load_asgi(self, urls, options):
+        handler = ASGIHandler()
+        deadline = time.monotonic() + options['seconds']
+        results = [([], [0]) for _ in range(options['concurrency'])]
+
+        async def client(durations, errors):
+            while time.monotonic() < deadline:
+                url = urls[len(durations) % len(urls)]
+                start = time.perf_counter()
+                status = await self.asgi_request(handler, url)
+                durations.append(time.perf_counter() - start)
+                if not 200 <= status < 400:
+                    errors[0] += 1
+
+        await asyncio.gather(*(client(*result) for result in results))
+        return [d for durations, _ in results for d in durations], sum(errors[0] for _, errors in results)
+
+    def environ(self, url):
+        return {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': HOST,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': HOST,
+            'HTTP_ACCEPT': 'application/json',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.url_scheme': 'http',
+        }
+
+    async def asgi_request(self, handler, url):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': [(b'host', HOST.encode()), (b'accept', b'application/json')],
+            'client': ('127.0.0.1', 0),
+            'server': (HOST, 80),
+        }
+        body_sent = False
+        disconnected = asyncio.Event()
+        status = []
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The handler listens for a disconnect while the view runs
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        await handler(scope, receive, send)
+        return status[0]
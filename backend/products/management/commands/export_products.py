@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from products.exports import PRODUCT_COLUMNS, product_export_queryset
+from tienda_backend import exports
+
+
+class Command(BaseCommand):
+    help = 'Export the product catalog as CSV or NDJSON (to standard output unless --output is given)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--output', help='File to write; standard output when omitted')
+        parser.add_argument('--category', type=int)
+        parser.add_argument('--active-only', action='store_true')
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = product_export_queryset(
+            category=options['category'],
+            active=True if options['active_only'] else None,
+        )
+        if not options['output']:
+            exports.write_export(self.stdout, queryset, PRODUCT_COLUMNS, options['file_format'], options['chunk_size'])
+            return
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as stream:
+            count = exports.write_export(
+                stream, queryset, PRODUCT_COLUMNS, options['file_format'], options['chunk_size']
+            )
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} products to {options["output"]}'))
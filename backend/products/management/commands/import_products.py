@@ -0,0 +1,54 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products import importer
+
+
+class Command(BaseCommand):
+    help = 'Create or update products from a CSV or NDJSON file ("-" reads standard input)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', dest='file_format', choices=importer.FORMATS)
+        parser.add_argument('--batch-size', type=int, default=importer.DEFAULT_BATCH_SIZE)
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create categories referenced by name that do not exist yet')
+        parser.add_argument('--max-errors', type=int, default=50, help='How many row errors to print')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        try:
+            file_format = options['file_format'] or importer.detect_format(path)
+        except importer.ImportFormatError as exc:
+            raise CommandError(f'{exc} (use --format)')
+
+        if path == '-':
+            result = self.run(sys.stdin.buffer, file_format, options)
+        else:
+            try:
+                with open(path, 'rb') as lines:
+                    result = self.run(lines, file_format, options)
+            except OSError as exc:
+                raise CommandError(str(exc))
+
+        for error in result.errors:
+            self.stderr.write(f'line {error["line"]}: {error["error"]}')
+        if result.error_count > len(result.errors):
+            self.stderr.write(f'... and {result.error_count - len(result.errors)} more errors')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Read {result.rows} rows in {result.elapsed:.1f}s ({result.rows_per_second} rows/s): '
+            f'{result.created} created, {result.updated} updated, {result.error_count} failed'
+        ))
+
+    def run(self, lines, file_format, options):
+        return importer.import_products(
+            lines,
+            file_format,
+            batch_size=options['batch_size'],
+            create_categories=options['create_categories'],
+            max_errors=options['max_errors'],
+        )
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:37
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A copy of products.search as of this migration, so later changes to the
+# tokenizer do not change what it builds
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    normalized = unicodedata.normalize('NFKD', text)
+    normalized = ''.join(c for c in normalized if not unicodedata.combining(c)).lower()
+    return [
+        token[:MAX_TOKEN_LENGTH]
+        for token in _TOKEN_RE.findall(normalized)
+        if len(token) >= MIN_TOKEN_LENGTH
+    ]
+
+
+def build_tokens(name, description):
+    weights = {}
+    for token in tokenize(name):
+        weights[token] = weights.get(token, 0) + NAME_WEIGHT
+    for token in tokenize(description):
+        weights[token] = weights.get(token, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+
+def build_search_index(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductSearchToken = apps.get_model('products', 'ProductSearchToken')
+    db = schema_editor.connection.alias
+
+    entries = []
+    products = Product.objects.using(db).filter(is_active=True).values_list('id', 'name', 'description')
+    for product_id, name, description in products:
+        for token, weight in build_tokens(name, description).items():
+            entries.append(ProductSearchToken(product_id=product_id, token=token, weight=weight))
+    ProductSearchToken.objects.using(db).bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_auto_20250818_1921'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'product'], name='products_search_token_idx')],
+                'unique_together': {('product', 'token')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
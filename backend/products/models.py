@@ -1,10 +1,14 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -23,9 +27,74 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        # Listings only ever show active products, so their indexes are
+        # partial on is_active (a plain index where the backend lacks them)
+        indexes = [
+            # Listing and keyset pagination on (created_at, id)
+            models.Index(fields=['created_at', 'id'], condition=Q(is_active=True), name='product_active_created_idx'),
+            # Listing filtered by category and the category products action
+            models.Index(
+                fields=['category', 'created_at', 'id'], condition=Q(is_active=True), name='product_active_cat_created_idx'
+            ),
+            # Search results and lookups by name
+            models.Index(fields=['name'], condition=Q(is_active=True), name='product_active_name_idx'),
+        ]
+    
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The category the row was read with: a product moved to another
+        # category has to leave the old one's cache too
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
+    
     @property
     def is_available(self):
         return self.stock > 0 and self.is_active
+
+
+class ProductSearchToken(models.Model):
+    """
+    Inverted index entry: one row per (product, token) with a ranking weight.
+    Maintained incrementally by products.search whenever a product is saved.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveSmallIntegerField(default=1)
+    
+    class Meta:
+        unique_together = ['product', 'token']
+        indexes = [
+            models.Index(fields=['token', 'product'], name='products_search_token_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} -> {self.product_id}"
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    from .search import index_product
+    index_product(instance, update_fields=kwargs.get('update_fields'))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    from .cache import invalidate_products
+    invalidate_products(
+        [instance.pk],
+        [instance.category_id, getattr(instance, '_loaded_category_id', None)],
+    )
+    instance._loaded_category_id = instance.category_id
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    from .cache import invalidate_category
+    invalidate_category(instance.pk)
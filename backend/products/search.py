@@ -0,0 +1,148 @@
+import re
+import unicodedata
+
+from django.db import connections, router
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+from .models import Product, ProductSearchToken
+
+# Ranking weights: a hit in the product name counts more than one in the description
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 8
+
+# Fields whose changes require the product to be re-indexed
+INDEXED_FIELDS = {'name', 'description', 'is_active'}
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """
+    Split text into lowercase, accent-free tokens ("Teléfono" -> "telefono")
+    """
+    if not text:
+        return []
+    normalized = unicodedata.normalize('NFKD', text)
+    normalized = ''.join(c for c in normalized if not unicodedata.combining(c)).lower()
+    return [
+        token[:MAX_TOKEN_LENGTH]
+        for token in _TOKEN_RE.findall(normalized)
+        if len(token) >= MIN_TOKEN_LENGTH
+    ]
+
+
+def build_tokens(name, description):
+    """
+    Return a {token: weight} mapping for a product's name and description
+    """
+    weights = {}
+    for token in tokenize(name):
+        weights[token] = weights.get(token, 0) + NAME_WEIGHT
+    for token in tokenize(description):
+        weights[token] = weights.get(token, 0) + DESCRIPTION_WEIGHT
+    return weights
+
+
+def index_product(product, update_fields=None):
+    """
+    Refresh the index entries of a single product.
+    Inactive products are removed from the index so they never show up in search.
+    """
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+
+    ProductSearchToken.objects.filter(product_id=product.pk).delete()
+    if not product.is_active:
+        return
+
+    ProductSearchToken.objects.bulk_create([
+        ProductSearchToken(product_id=product.pk, token=token, weight=weight)
+        for token, weight in build_tokens(product.name, product.description).items()
+    ])
+
+
+def index_products(products):
+    """
+    Refresh the index entries of many products at once, for bulk writes
+    that do not go through the post_save signal. The entries are written
+    with one executemany INSERT: building a model instance per token is
+    most of the cost of a large import.
+    """
+    products = list(products)
+    ProductSearchToken.objects.filter(product_id__in=[product.pk for product in products]).delete()
+    rows = [
+        (product.pk, token, weight)
+        for product in products
+        if product.is_active
+        for token, weight in build_tokens(product.name, product.description).items()
+    ]
+    if not rows:
+        return
+    connection = connections[router.db_for_write(ProductSearchToken)]
+    table = connection.ops.quote_name(ProductSearchToken._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {table} (product_id, token, weight) VALUES (%s, %s, %s)', rows)
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuild the whole index from scratch. Returns the number of indexed products.
+    """
+    ProductSearchToken.objects.all().delete()
+
+    indexed = 0
+    entries = []
+    products = Product.objects.filter(is_active=True).values_list('id', 'name', 'description')
+    for product_id, name, description in products.iterator(chunk_size=batch_size):
+        for token, weight in build_tokens(name, description).items():
+            entries.append(ProductSearchToken(product_id=product_id, token=token, weight=weight))
+        indexed += 1
+        if len(entries) >= batch_size:
+            ProductSearchToken.objects.bulk_create(entries, batch_size=batch_size)
+            entries = []
+
+    ProductSearchToken.objects.bulk_create(entries, batch_size=batch_size)
+    return indexed
+
+
+def _prefix_match(term):
+    # A range on the indexed token column instead of LIKE, so the index is
+    # used on every backend regardless of collation
+    return Q(search_tokens__token__gte=term, search_tokens__token__lt=term + '\uffff')
+
+
+def search_products(query, queryset=None):
+    """
+    Return active products matching every term of the query (prefix match),
+    ranked by the accumulated weight of the matching tokens.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if queryset is None:
+        queryset = Product.objects.filter(is_active=True)
+    if not terms:
+        return queryset.none()
+
+    any_term = Q()
+    for term in terms:
+        any_term |= _prefix_match(term)
+
+    term_hits = {
+        f'_term_{i}': Max(Case(
+            When(_prefix_match(term), then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+        for i, term in enumerate(terms)
+    }
+
+    return (
+        queryset
+        .filter(any_term)
+        .annotate(search_rank=Sum('search_tokens__weight'), **term_hits)
+        .filter(**{name: 1 for name in term_hits})
+        .order_by('-search_rank', 'name', 'id')
+    )
@@ -1,12 +1,15 @@
+from django.db import transaction
 from rest_framework import serializers
+from cart.reservations import on_hand, on_hand_error
 from .models import Product, Category
+from tienda_backend.sparse import SparseFieldsMixin
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True)
     
@@ -14,3 +17,27 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'name', 'description', 'price', 'stock', 'category', 'category_id', 'image', 'is_active', 'created_at', 'updated_at', 'is_available']
         read_only_fields = ['id', 'created_at', 'updated_at', 'is_available']
+        # Lists and carts/orders: category as an id unless ?expand=category
+        compact_fields = ['id', 'name', 'price', 'stock', 'category', 'image', 'is_available']
+        expandable_fields = ['category']
+        field_sources = {'is_available': ['stock', 'is_active']}
+    
+    def update(self, instance, validated_data):
+        """
+        Save only the given fields, so stock read with the instance never
+        overwrites a hold taken since. stock is written as units on hand, as
+        by update_stock: the units held by carts are subtracted in the same
+        UPDATE.
+        """
+        with transaction.atomic():
+            if 'stock' in validated_data:
+                error = on_hand_error(instance.pk, validated_data['stock'])
+                if error:
+                    raise serializers.ValidationError({'stock': [error]})
+                validated_data['stock'] = on_hand(validated_data['stock'])
+            for name, value in validated_data.items():
+                setattr(instance, name, value)
+            instance.save(update_fields=[*validated_data, 'updated_at'])
+        if 'stock' in validated_data:
+            instance.refresh_from_db(fields=['stock'])
+        return instance
@@ -1,3 +1,527 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from cart.models import StockReservation
+from cart.reservations import release_expired
+from tienda_backend import fast_json
+
+from .models import Category, Product
+from .search import search_products
+
+
+class CatalogCacheTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff', password='secret-pass-123', is_staff=True)
+        self.category = Category.objects.create(name='Cache')
+        self.product = Product.objects.create(
+            name='Speaker', description='Bluetooth speaker', price=Decimal('45.00'), stock=7, category=self.category,
+        )
+
+    def test_cached_detail_is_served_without_queries(self):
+        url = f'/api/products/{self.product.id}/'
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.data['stock'], 7)
+
+    def test_writes_invalidate_cached_responses(self):
+        detail = f'/api/products/{self.product.id}/'
+        listing = f'/api/categories/{self.category.id}/products/'
+        self.client.get(detail)
+        self.client.get(listing)
+
+        self.client.force_authenticate(self.staff)
+        self.client.post(f'{detail}update_stock/', {'quantity': 3}, format='json')
+        self.assertEqual(self.client.get(detail).data['stock'], 3)
+
+        self.client.delete(detail)
+        self.assertEqual(self.client.get(listing).data, [])
+        self.assertEqual(self.client.get(detail).status_code, 404)
+
+    def test_category_changes_invalidate_product_details(self):
+        detail = f'/api/products/{self.product.id}/'
+        etag = self.client.get(detail)['ETag']
+
+        self.category.name = 'Audio'
+        self.category.save()
+        response = self.client.get(detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['category']['name'], 'Audio')
+
+    def test_moving_a_product_invalidates_both_categories_without_a_read(self):
+        old_listing = f'/api/categories/{self.category.id}/products/'
+        self.assertEqual(len(self.client.get(old_listing).data), 1)
+        other = Category.objects.create(name='Other')
+
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = other
+        with CaptureQueriesContext(connection) as context:
+            product.save()
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('SELECT')])
+        self.assertEqual(self.client.get(old_listing).data, [])
+        self.assertEqual(len(self.client.get(f'/api/categories/{other.id}/products/').data), 1)
+
+    def test_conditional_get_returns_not_modified(self):
+        url = f'/api/products/{self.product.id}/'
+        first = self.client.get(url)
+        self.assertIn('Last-Modified', first)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        self.client.force_authenticate(self.staff)
+        self.client.post(f'{url}update_stock/', {'quantity': 2}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 2)
+
+
+class ProductImportTest(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='importer', password='secret-pass-123', is_staff=True)
+        self.category = Category.objects.create(name='Audio')
+        self.product = Product.objects.create(
+            name='Old name', description='', price=Decimal('1.00'), stock=1, category=self.category,
+        )
+
+    def test_csv_upload_creates_updates_and_reports_errors(self):
+        content = (
+            'id,name,description,price,stock,category\n'
+            f'{self.product.id},Headphones,Wireless headphones,99.90,4,audio\n'
+            ',Turntable,Belt drive turntable,250,2,Audio\n'
+            ',Broken,,not-a-price,1,Audio\n'
+            ',Radio,,20,1,Unknown\n'
+            '999999,Ghost,,5,1,Audio\n'
+        ).encode('utf-8')
+        upload = SimpleUploadedFile('catalog.csv', content, content_type='text/csv')
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/products/import/', {'file': upload, 'batch_size': 2}, format='multipart')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], 5)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 3))
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5, 6])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.stock), ('Headphones', 4))
+        self.assertEqual([p.name for p in search_products('turntable')], ['Turntable'])
+
+    def test_updates_only_write_the_given_columns(self):
+        Product.objects.filter(pk=self.product.pk).update(description='Kept', stock=7, is_active=False)
+        other = Product.objects.create(
+            name='Speaker', description='Bluetooth speaker', price=Decimal('30.00'), stock=5, category=self.category,
+        )
+        content = f'id,price\n{self.product.id},12.50\n{other.id},35\n'.encode('utf-8')
+        upload = SimpleUploadedFile('prices.csv', content, content_type='text/csv')
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+
+        self.assertEqual((response.data['updated'], response.data['failed']), (2, 0))
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[self.product.pk, other.pk]).order_by('pk').values_list(
+                'name', 'description', 'price', 'stock', 'is_active',
+            )),
+            [
+                ('Old name', 'Kept', Decimal('12.50'), 7, False),
+                ('Speaker', 'Bluetooth speaker', Decimal('35.00'), 5, True),
+            ],
+        )
+        self.assertEqual([p.name for p in search_products('bluetooth')], ['Speaker'])
+
+    def test_stock_is_imported_as_units_on_hand(self):
+        StockReservation.objects.create(
+            product=self.product, quantity=3, expires_at=datetime.now(timezone.utc) + timedelta(minutes=5),
+        )
+        content = f'id,stock\n{self.product.id},10\n'.encode('utf-8')
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv') as source:
+            source.write(content)
+            source.flush()
+            call_command('import_products', source.name, stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+
+    def test_import_requires_staff(self):
+        upload = SimpleUploadedFile('catalog.csv', b'name\n', content_type='text/csv')
+        response = self.client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_command_imports_ndjson_and_creates_categories(self):
+        rows = [
+            {'name': 'Lamp', 'price': '15.5', 'stock': 3, 'category': 'Lighting'},
+            {'name': 'Bulb', 'price': 2, 'stock': 10, 'category': 'lighting', 'is_active': False},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson') as source:
+            source.write('\n'.join(json.dumps(row) for row in rows))
+            source.flush()
+            call_command('import_products', source.name, '--create-categories', stdout=StringIO())
+
+        lighting = Category.objects.get(name='Lighting')
+        self.assertEqual(
+            sorted(lighting.products.values_list('name', 'price', 'is_active')),
+            [('Bulb', Decimal('2.00'), False), ('Lamp', Decimal('15.50'), True)],
+        )
+
+
+class BulkStockTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='inventory', password='secret-pass-123', is_staff=True)
+        category = Category.objects.create(name='Stock')
+        self.first, self.second = Product.objects.bulk_create([
+            Product(name='Cable', description='', price=Decimal('5.00'), stock=10, category=category),
+            Product(name='Adapter', description='', price=Decimal('8.00'), stock=2, category=category),
+        ])
+
+    def test_bulk_stock_applies_values_and_deltas_in_one_statement(self):
+        self.client.get(f'/api/products/{self.first.id}/')
+        self.client.force_authenticate(self.staff)
+        updates = [
+            {'id': self.first.id, 'delta': -4},
+            {'id': self.second.id, 'delta': -3},
+            {'id': 999999, 'stock': 1},
+            {'id': self.second.id, 'stock': 5},
+        ]
+        with self.assertNumQueries(4):  # savepoint, locked read, UPDATE, release
+            response = self.client.post('/api/products/bulk_stock/', {'updates': updates}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(
+            sorted(response.data['results'], key=lambda result: result['id']),
+            [
+                {'id': self.first.id, 'stock': 6},
+                {'id': self.second.id, 'error': 'Duplicate id'},
+                {'id': self.second.id, 'error': 'Insufficient stock'},
+                {'id': 999999, 'error': 'Product not found'},
+            ],
+        )
+        self.assertEqual(self.client.get(f'/api/products/{self.first.id}/').data['stock'], 6)
+
+    def test_absolute_values_count_the_held_units(self):
+        shopper = User.objects.create_user(username='holder')
+        self.client.force_authenticate(shopper)
+        self.client.post('/api/cart/add_item/', {'product_id': self.first.id, 'quantity': 3}, format='json')
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.post('/api/products/bulk_stock/', {'updates': [
+            {'id': self.first.id, 'stock': 10}, {'id': self.second.id, 'stock': 4},
+        ]}, format='json')
+        self.assertEqual(
+            sorted(response.data['results'], key=lambda result: result['id']),
+            [{'id': self.first.id, 'stock': 7}, {'id': self.second.id, 'stock': 4}],
+        )
+        response = self.client.post('/api/products/bulk_stock/', {'updates': [
+            {'id': self.first.id, 'stock': 2},
+        ]}, format='json')
+        self.assertEqual(response.data['errors'], 1)
+
+        StockReservation.objects.update(expires_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+        release_expired()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock, 10)
+
+    def test_bulk_stock_requires_staff(self):
+        self.client.force_authenticate(User.objects.create_user(username='shopper', password='secret-pass-123'))
+        response = self.client.post('/api/products/bulk_stock/', {'updates': [{'id': self.first.id, 'stock': 1}]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductExportTest(APITestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='exporter', password='secret-pass-123', is_staff=True)
+        self.category = Category.objects.create(name='Export')
+        Product.objects.bulk_create([
+            Product(name=f'Item {i}', description='Line, with comma', price=Decimal('3.50'), stock=i, category=self.category,
+                    is_active=i != 2)
+            for i in range(5)
+        ])
+
+    def test_csv_export_streams_every_product(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(f'/api/products/export/?category={self.category.id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(lines[0].split(',')[:5], ['id', 'name', 'description', 'price', 'stock'])
+        self.assertEqual(len(lines), 6)
+        self.assertIn('"Line, with comma",3.50', lines[1])
+
+    def test_export_round_trips_through_import(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(f'/api/products/export/?file_format=ndjson&active=false&category={self.category.id}')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Item 2'])
+        self.assertEqual(rows[0]['price'], '3.50')
+
+        upload = SimpleUploadedFile('products.ndjson', b''.join(
+            json.dumps(dict(row, stock=40)).encode('utf-8') + b'\n' for row in rows
+        ))
+        result = self.client.post('/api/products/import/', {'file': upload}, format='multipart').data
+        self.assertEqual((result['updated'], result['failed']), (1, 0))
+        self.assertEqual(Product.objects.get(name='Item 2').stock, 40)
+
+    def test_export_writes_units_on_hand_so_reimports_keep_holds(self):
+        product = Product.objects.get(name='Item 4')
+        StockReservation.objects.create(
+            product=product, quantity=3, expires_at=datetime.now(timezone.utc) + timedelta(minutes=5),
+        )
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(f'/api/products/export/?file_format=ndjson&category={self.category.id}')
+        exported = b''.join(response.streaming_content)
+        self.assertEqual(json.loads(exported.splitlines()[-1])['stock'], 7)
+
+        upload = SimpleUploadedFile('products.ndjson', exported)
+        result = self.client.post('/api/products/import/', {'file': upload}, format='multipart').data
+        self.assertEqual(result['failed'], 0)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 4)
+
+    def test_export_requires_staff(self):
+        self.assertIn(self.client.get('/api/products/export/').status_code, (401, 403))
+
+
+class SparseFieldsetTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Sparse', description='Long category text')
+        self.product = Product.objects.create(
+            name='Lamp', description='Desk lamp with a long description', price=Decimal('12.00'), stock=3,
+            category=self.category,
+        )
+
+    def test_list_is_compact_and_detail_is_full(self):
+        item = self.client.get(f'/api/products/?category={self.category.id}').data['results'][0]
+        self.assertEqual(
+            set(item), {'id', 'name', 'price', 'stock', 'category', 'image', 'is_available'}
+        )
+        self.assertEqual(item['category'], self.category.id)
+
+        detail = self.client.get(f'/api/products/{self.product.id}/').data
+        self.assertEqual(detail['description'], 'Desk lamp with a long description')
+        self.assertEqual(detail['category']['name'], 'Sparse')
+
+    def test_fields_exclude_and_expand(self):
+        item = self.client.get(
+            f'/api/products/?category={self.category.id}&fields=id,name,category.name&expand=category'
+        ).data['results'][0]
+        self.assertEqual(item, {'id': self.product.id, 'name': 'Lamp', 'category': {'name': 'Sparse'}})
+
+        detail = self.client.get(f'/api/products/{self.product.id}/?exclude=description,category.description').data
+        self.assertNotIn('description', detail)
+        self.assertNotIn('description', detail['category'])
+        self.assertEqual(detail['category']['name'], 'Sparse')
+
+    def test_queryset_only_loads_emitted_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/products/?category={self.category.id}&fields=id,name')
+        self.assertEqual(response.data['results'], [{'id': self.product.id, 'name': 'Lamp'}])
+        select = context.captured_queries[-1]['sql']
+        self.assertNotIn('"products_product"."description"', select)
+        self.assertNotIn('JOIN', select)
+
+    def test_writes_ignore_sparse_fieldsets(self):
+        self.client.force_authenticate(User.objects.create_user(username='sparse_staff', is_staff=True))
+        url = f'/api/products/{self.product.id}/?fields=id'
+        response = self.client.patch(url, {'name': 'Floor lamp'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Floor lamp')
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Floor lamp')
+
+        response = self.client.post('/api/products/?fields=id', {
+            'name': 'Bulb', 'description': 'LED bulb', 'price': '3.00', 'stock': 4, 'category_id': self.category.id,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.get(pk=response.data['id']).price, Decimal('3.00'))
+
+
+class FastSerializationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Fast', description='Compiled plans')
+        Product.objects.bulk_create([
+            Product(name=f'Fast {i}', description='Same output', price=Decimal('9.90') + i, stock=i % 2,
+                    category=self.category, image='products/fast.jpg' if i else '')
+            for i in range(3)
+        ])
+
+    def get_both(self, url):
+        responses = []
+        for enabled in (False, True):
+            cache.clear()
+            with self.settings(FAST_SERIALIZATION=enabled):
+                responses.append(self.client.get(url))
+        return responses
+
+    def test_lists_match_the_serializers(self):
+        for url in (
+            f'/api/products/?category={self.category.id}',
+            f'/api/products/?category={self.category.id}&cursor=&page_size=2',
+            f'/api/products/?category={self.category.id}&expand=category&exclude=category.created_at',
+            f'/api/categories/{self.category.id}/products/?fields=id,image,is_available,updated_at',
+        ):
+            slow, fast = self.get_both(url)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(fast.content, slow.content, url)
+
+
+class FastJSONTest(APITestCase):
+    data = {
+        'price': '12.50',
+        'total': Decimal('25.50'),
+        'created_at': datetime(2025, 8, 18, 19, 24, 3, 123456, tzinfo=timezone.utc),
+        'day': datetime(2025, 8, 18).date(),
+        'label': gettext_lazy('Name'),
+        'text': 'línea\u2028separada',
+        'ids': (1, 2),
+        1: None,
+    }
+
+    def test_renderer_matches_drf(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(fast_json.FastJSONRenderer().render(self.data), expected)
+        with mock.patch.object(fast_json, 'orjson', None):
+            self.assertEqual(fast_json.FastJSONRenderer().render(self.data), expected)
+        # Out of orjson's range: stdlib fallback
+        self.assertEqual(fast_json.FastJSONRenderer().render({'n': 2 ** 70}), b'{"n":1180591620717411303424}')
+
+    def test_parser(self):
+        parser = fast_json.FastJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"q": "café", "n": 1.5}'.encode())), {'q': 'café', 'n': 1.5})
+        with self.assertRaisesRegex(ParseError, 'JSON parse error - Expecting'):
+            parser.parse(BytesIO(b'{"q": '))
+
+    def test_large_responses_are_compressed(self):
+        category = Category.objects.create(name='Compressed')
+        Product.objects.bulk_create([
+            Product(name=f'Compressed {i}', description='', price=Decimal('1.00'), stock=1, category=category)
+            for i in range(10)
+        ])
+        url = f'/api/products/?category={category.id}'
+        plain = self.client.get(url)
+
+        with self.settings(API_COMPRESSION=True, API_COMPRESSION_MIN_SIZE=200):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertTrue(response['ETag'].startswith('W/'))
+            self.assertEqual(gzip.decompress(response.content), plain.content)
+
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING='identity')
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(ROOT_URLCONF='tienda_backend.asgi_urls')
+class AsyncCatalogTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Async', description='Native reads')
+        self.products = [
+            Product.objects.create(
+                name=f'Async lamp {i}', description='Desk lamp', price=Decimal('19.90') + i, stock=i % 2,
+                category=self.category, image='products/lamp.jpg' if i else '',
+            )
+            for i in range(3)
+        ]
+
+    def get_both(self, url, **headers):
+        """
+        The response of the sync viewset and of the async view, each on a cold cache
+        """
+        cache.clear()
+        with self.settings(ROOT_URLCONF='tienda_backend.urls'):
+            sync_response = self.client.get(url, **headers)
+        cache.clear()
+        return sync_response, async_to_sync(self.async_client.get)(url, **headers)
+
+    def test_reads_match_the_viewsets(self):
+        product = self.products[0]
+        for url in (
+            f'/api/products/?category={self.category.id}',
+            f'/api/products/?category={self.category.id}&page_size=2&page=2',
+            f'/api/products/?category={self.category.id}&cursor=&page_size=2&count=approx',
+            f'/api/products/?category={self.category.id}&expand=category&exclude=category.created_at',
+            f'/api/products/{product.id}/',
+            f'/api/products/{product.id}/?fields=id,name',
+            '/api/products/search/?q=lamp&page_size=2',
+            '/api/products/search/',
+            '/api/categories/',
+            f'/api/categories/{self.category.id}/products/',
+            '/api/products/999999/',
+            '/api/products/abc/',
+            '/api/categories/abc/products/',
+            '/api/products/?page=9',
+        ):
+            sync_response, async_response = self.get_both(url)
+            self.assertEqual(async_response.status_code, sync_response.status_code, url)
+            self.assertEqual(async_response.content, sync_response.content, url)
+            for header in ('ETag', 'Last-Modified', 'Allow', 'Content-Type'):
+                self.assertEqual(async_response.get(header), sync_response.get(header), (url, header))
+
+    def test_search_answers_a_page_for_empty_and_short_queries(self):
+        shape = set(json.loads(self.get_both('/api/products/search/?q=lamp')[0].content))
+        for url in ('/api/products/search/', '/api/products/search/?q=a'):
+            sync_response, async_response = self.get_both(url)
+            body = json.loads(sync_response.content)
+            self.assertEqual(set(body), shape, url)
+            self.assertEqual(body['results'], [], url)
+            self.assertEqual(async_response.content, sync_response.content, url)
+
+    def test_shares_cache_entries_and_validators(self):
+        url = f'/api/products/{self.products[1].id}/'
+        first = self.client.get(url)
+
+        response = async_to_sync(self.async_client.get)(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        async def read_cached():
+            return await self.async_client.get(url)
+
+        with self.assertNumQueries(0):
+            response = async_to_sync(read_cached)()
+        self.assertEqual(response.content, first.content)
+
+    def test_browsable_api_and_writes_use_the_viewsets(self):
+        url = f'/api/products/{self.products[0].id}/'
+        response = async_to_sync(self.async_client.get)(url, headers={'Accept': 'text/html'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+        response = async_to_sync(self.async_client.delete)(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        # List-level actions are not product ids
+        response = async_to_sync(self.async_client.get)('/api/products/export/')
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_load_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_catalog_load', concurrency=2, seconds=0.2, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines[1:]], ['wsgi', 'asgi'])
@@ -1,20 +1,78 @@
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models.functions import Now
 from django.shortcuts import get_object_or_404
 from .models import Product, Category
 from .serializers import ProductSerializer, CategorySerializer
+from .search import search_products
+from . import importer
+from . import inventory
+from .exports import PRODUCT_COLUMNS, product_export_queryset
+from . import cache as catalog_cache
+from .cache import CatalogCacheMixin
+from cart.reservations import on_hand, on_hand_error
+from tienda_backend.conditional import latest, list_validators, make_version, row_validators
+from tienda_backend.exports import requested_format, streaming_export
+from tienda_backend.pagination import KeysetPagination
+from tienda_backend.parsing import parse_int
+from tienda_backend.routing import ReplicaReadMixin
+from tienda_backend import fast_serializers
+from tienda_backend.fast_serializers import FastListMixin
+from tienda_backend.sparse import only_emitted
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    replica_actions = ('list', 'retrieve', 'products')
+    
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache.request_key('categories', catalog_cache.get_version('listing'), request)
+        return self.cached_response(
+            request, key,
+            lambda: list_validators(self.filter_queryset(self.get_queryset()), 'updated_at'),
+            super().list, *args, **kwargs
+        )
     
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
+        key = catalog_cache.request_key(
+            f'category:{pk}', catalog_cache.get_version(f'category:{pk}'), request
+        )
+        return self.cached_response(
+            request, key,
+            lambda: self.category_products_validators(pk),
+            self.list_products
+        )
+    
+    @classmethod
+    def category_products(cls, pk):
+        """
+        Active products of a category, as the products action serves them
+        """
+        return Product.objects.filter(category_id=pk, is_active=True).select_related('category')
+    
+    def category_products_validators(self, pk):
+        category_validators = row_validators(Category.objects.filter(pk=pk), 'updated_at')
+        if category_validators is None:
+            return None
+        version, category_updated = category_validators
+        products_version, products_updated = list_validators(self.category_products(pk), 'updated_at')
+        return make_version(version, products_version), latest(category_updated, products_updated)
+    
+    def list_products(self, request):
         category = self.get_object()
-        products = Product.objects.filter(category=category, is_active=True)
-        serializer = ProductSerializer(products, many=True)
+        context = self.get_serializer_context()
+        products = self.category_products(category.pk)
+        if fast_serializers.is_enabled():
+            data = fast_serializers.serialize(products, ProductSerializer(many=True, context=context))
+            if data is not None:
+                return Response(data)
+        products = only_emitted(products, ProductSerializer(many=True, context=context))
+        serializer = ProductSerializer(products, many=True, context=context)
         return Response(serializer.data)
     
     def destroy(self, request, *args, **kwargs):
@@ -66,8 +124,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
         
         # Deactivate all products in this category
         products = Product.objects.filter(category=category)
-        product_count = products.count()
+        product_ids = list(products.values_list('id', flat=True))
+        product_count = len(product_ids)
         products.update(is_active=False)
+        catalog_cache.invalidate_products(product_ids, [category.id])
         
         category_name = category.name
         category.delete()
@@ -79,43 +139,202 @@ class CategoryViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, CatalogCacheMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    # Read actions only load the columns the requested representation emits
+    sparse_actions = ('list', 'retrieve')
+    replica_actions = ('list', 'retrieve', 'search')
     
-    def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True)
-        category = self.request.query_params.get('category', None)
+    @classmethod
+    def active_products(cls, category=None):
+        """
+        Products the catalog shows, optionally of one category (the
+        ?category= filter)
+        """
+        queryset = Product.objects.filter(is_active=True).select_related('category')
         if category:
             queryset = queryset.filter(category_id=category)
         return queryset
     
+    def get_queryset(self):
+        queryset = self.active_products(self.request.query_params.get('category', None))
+        if self.action in self.sparse_actions and not self.use_fast_serialization():
+            queryset = self.only_emitted(queryset)
+        return queryset
+    
+    def only_emitted(self, queryset):
+        # created_at is read by keyset pagination to build the cursors
+        serializer = self.get_serializer(many=self.action != 'retrieve')
+        return only_emitted(queryset, serializer, extra=['created_at'])
+    
+    def list(self, request, *args, **kwargs):
+        key = catalog_cache.request_key('products', catalog_cache.get_version('listing'), request)
+        return self.cached_response(
+            request, key,
+            lambda: list_validators(
+                self.filter_queryset(self.get_queryset()), 'updated_at', 'category__updated_at'
+            ),
+            super().list, *args, **kwargs
+        )
+    
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs.get(self.lookup_field)
+        key = catalog_cache.request_key(
+            f'product:{pk}', catalog_cache.get_version(f'product:{pk}'), request
+        )
+        return self.cached_response(
+            request, key,
+            lambda: row_validators(
+                self.get_queryset().filter(pk=pk), 'updated_at', 'category__updated_at'
+            ),
+            super().retrieve, *args, **kwargs
+        )
+    
     @action(detail=False, methods=['get'])
     def search(self, request):
-        query = request.query_params.get('q', '')
-        if query:
-            products = Product.objects.filter(
-                name__icontains=query,
-                is_active=True
+        # An empty or too short query matches nothing, in the same
+        # paginated shape as any other search
+        products = search_products(
+            request.query_params.get('q', ''),
+            self.only_emitted(self.active_products())
+        )
+        page = self.paginate_queryset(products)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(products, many=True)
+        return Response(serializer.data)
+    
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Create or update products from an uploaded CSV or NDJSON file (staff only)
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only staff members can import products'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response(
+                {'error': 'A CSV or NDJSON file is required'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        file_format = request.data.get('file_format')
+        try:
+            if file_format not in importer.FORMATS:
+                file_format = importer.detect_format(upload.name, upload.content_type)
+        except importer.ImportFormatError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            batch_size = int(request.data.get('batch_size', importer.DEFAULT_BATCH_SIZE))
+        except (TypeError, ValueError):
+            batch_size = 0
+        if not 1 <= batch_size <= importer.MAX_BATCH_SIZE:
+            return Response(
+                {'error': f'batch_size must be between 1 and {importer.MAX_BATCH_SIZE}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        result = importer.import_products(
+            upload,
+            file_format,
+            batch_size=batch_size,
+            create_categories=str(request.data.get('create_categories', '')).lower() in ('1', 'true', 'yes'),
+        )
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the whole catalog, inactive products included, as CSV or
+        NDJSON (staff only). Filters: ?category=<id>, ?active=true|false
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only staff members can export the catalog'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        file_format = requested_format(request)
+        if file_format is None:
+            return Response(
+                {'error': 'file_format must be csv or ndjson'}, 
+                status=status.HTTP_400_BAD_REQUEST
             )
-            serializer = self.get_serializer(products, many=True)
-            return Response(serializer.data)
-        return Response([])
+        
+        active = request.query_params.get('active')
+        queryset = product_export_queryset(
+            category=request.query_params.get('category'),
+            active=None if active is None else active.lower() in ('1', 'true', 'yes'),
+        )
+        return streaming_export(queryset, PRODUCT_COLUMNS, file_format, 'products')
+    
+    @action(detail=False, methods=['post'])
+    def bulk_stock(self, request):
+        """
+        Set or adjust the stock of many products in one transaction (staff only).
+        Body: {"updates": [{"id": 1, "stock": 10}, {"id": 2, "delta": -3}, ...]}
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Only staff members can update stock in bulk'}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        updates = request.data.get('updates')
+        if not isinstance(updates, list) or not updates:
+            return Response(
+                {'error': 'updates must be a non-empty list'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if len(updates) > inventory.MAX_STOCK_UPDATES:
+            return Response(
+                {'error': f'At most {inventory.MAX_STOCK_UPDATES} updates are accepted per request'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            results = inventory.apply_stock_updates(updates)
+        except inventory.StockConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        
+        return Response({
+            'updated': sum(1 for result in results if 'stock' in result),
+            'errors': sum(1 for result in results if 'error' in result),
+            'results': results
+        })
     
     @action(detail=True, methods=['post'])
     def update_stock(self, request, pk=None):
+        """
+        Set the units on hand. Product.stock excludes the units held by carts,
+        so it is set to quantity minus the outstanding holds.
+        """
         product = self.get_object()
-        quantity = request.data.get('quantity', 0)
+        quantity = parse_int(request.data.get('quantity', 0))
         
-        if quantity < 0:
+        if quantity is None or quantity < 0:
             return Response(
-                {'error': 'Quantity cannot be negative'}, 
+                {'error': 'Quantity must be a non-negative integer'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        product.stock = quantity
-        product.save()
+        with transaction.atomic():
+            error = on_hand_error(product.pk, quantity)
+            if error:
+                return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+            Product.objects.filter(pk=product.pk).update(stock=on_hand(quantity), updated_at=Now())
+        catalog_cache.invalidate_products([product.pk], [product.category_id])
+        product.refresh_from_db()
         serializer = self.get_serializer(product)
         return Response(serializer.data)
     
@@ -0,0 +1,13 @@
+"""
+URL configuration for ASGI deployments (ASYNC_CATALOG): the catalog reads
+are served by async views in front of the usual routes, which handle
+everything else.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('products.async_views')),
+    *sync_urlpatterns,
+]
@@ -0,0 +1,129 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_KEY_PREFIX = 'auth:user:'
+
+# Cached in place of a user that was deactivated or deleted
+BLOCKED = 'blocked'
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+
+def user_key(user_id):
+    return f'{USER_KEY_PREFIX}{user_id}'
+
+
+def forget_user(user_id):
+    """
+    Drop a cached user; the users app calls it when a user is saved or deleted
+    """
+    get_cache().delete(user_key(user_id))
+
+
+def block_user(user_id):
+    """
+    Mark a deactivated or deleted user as such for as long as its access
+    tokens live, so claims-only reads reject them too
+    """
+    get_cache().set(user_key(user_id), BLOCKED, api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+
+
+def claims_only_enabled():
+    enabled = getattr(settings, 'AUTH_CLAIMS_ONLY', None)
+    if enabled is None:
+        # A per-process cache only blocks a deactivated or deleted user in
+        # the process that saved it: the others would take its tokens on a miss
+        return not isinstance(get_cache(), (LocMemCache, DummyCache))
+    return enabled
+
+
+def uses_claims_only(request):
+    if request.method not in SAFE_METHODS or not claims_only_enabled():
+        return False
+    view = (getattr(request, 'parser_context', None) or {}).get('view')
+    return getattr(view, 'action', None) in getattr(view, 'claims_only_actions', ())
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that reads the token's user from the cache for up to
+    AUTH_USER_CACHE_TIMEOUT seconds instead of querying it on every request.
+    Saving or deleting a user drops its entry (queryset.update() does not:
+    call forget_user() after bulk changes).
+
+    Read-only actions listed in a view's claims_only_actions only need the
+    user id: where the cache is shared between processes (AUTH_CLAIMS_ONLY),
+    they get a TokenUser built from the token claims. The cached
+    entry is still checked when there is one (deactivated and deleted users
+    leave a BLOCKED entry), but a cache miss costs no lookup. A TokenUser is
+    not a model instance (filter on user_id=request.user.pk, and call
+    get_user() before creating rows for it) and is never staff.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if uses_claims_only(request):
+            return self.get_token_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def get_token_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        cached = get_cache().get(user_key(user_id))
+        if cached is not None:
+            user = cached if isinstance(cached, self.user_model) else self.load_user(user_id)
+            self.check_user(user, validated_token)
+        return api_settings.TOKEN_USER_CLASS(validated_token)
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = get_cache().get(user_key(user_id))
+        if not isinstance(user, self.user_model):
+            user = self.load_user(user_id)
+        self.check_user(user, validated_token)
+        return user
+
+    def load_user(self, user_id):
+        try:
+            user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if user.is_active:
+            # Inactive users keep their BLOCKED entry
+            get_cache().set(user_key(user_id), user, get_timeout())
+        return user
+
+    def check_user(self, user, validated_token):
+        # The same checks as JWTAuthentication, on cached users too
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and (
+            validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Random bytes added to gzip output, as in Django's GZipMiddleware (BREACH mitigation)
+MAX_RANDOM_BYTES = 100
+
+
+def accepted_encodings(header):
+    """
+    Codings the client accepts, from an Accept-Encoding header (q=0 means refused)
+    """
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress response bodies of at least API_COMPRESSION_MIN_SIZE bytes with
+    brotli (when installed and accepted) or gzip, if API_COMPRESSION is on.
+    Streaming responses (exports) are left alone: they are sent as they are
+    produced and their size is not known up front.
+    """
+
+    def process_response(self, request, response):
+        if not getattr(settings, 'API_COMPRESSION', False) or response.streaming:
+            return response
+        if len(response.content) < getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024):
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in accepted:
+            coding = 'br'
+            content = brotli.compress(response.content, quality=getattr(settings, 'API_COMPRESSION_BROTLI_QUALITY', 5))
+        elif 'gzip' in accepted:
+            coding = 'gzip'
+            content = compress_string(response.content, max_random_bytes=MAX_RANDOM_BYTES)
+        else:
+            return response
+
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response.headers['Content-Length'] = str(len(content))
+        # The compressed body is a different representation: weaken strong ETags
+        # (conditional GETs compare ETags weakly, so revalidation keeps working)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,134 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_version(*parts):
+    """
+    Compact fingerprint of the validator values of a resource
+    """
+    raw = '|'.join('' if part is None else str(part) for part in parts)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def latest(*timestamps):
+    present = [timestamp for timestamp in timestamps if timestamp is not None]
+    return max(present) if present else None
+
+
+def representation_etag(version, renderer_format):
+    # The same data rendered as JSON or as the browsable API is a different representation
+    return quote_etag(make_version(version, renderer_format))
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Evaluate If-None-Match / If-Modified-Since for a GET request
+    (If-None-Match takes precedence, as in RFC 9110)
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags:
+            return True
+        opaque = etag.removeprefix('W/')
+        return any(candidate.removeprefix('W/') == opaque for candidate in etags)
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+    return False
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for viewset GET actions.
+
+    Validators are cheap values read from the database (a row's updated_at,
+    or MAX(updated_at) plus COUNT for lists); when the client already has the
+    current representation a 304 is returned without running the handler,
+    so nothing is serialized.
+    """
+
+    def get_etag(self, request, version):
+        renderer = getattr(request, 'accepted_renderer', None)
+        return representation_etag(version, getattr(renderer, 'format', ''))
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        return response
+
+    def not_modified(self, etag, last_modified):
+        return self.set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+    def conditional_response(self, request, validators, handler, *args, **kwargs):
+        """
+        validators is None (resource not found: let the handler answer)
+        or a (version, last_modified) pair
+        """
+        if validators is None:
+            return handler(request, *args, **kwargs)
+
+        version, last_modified = validators
+        etag = self.get_etag(request, version)
+        if is_not_modified(request, etag, last_modified):
+            return self.not_modified(etag, last_modified)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+
+def _list_aggregates(timestamp_fields):
+    return {'count': Count('pk'), **{f'last_{i}': Max(field) for i, field in enumerate(timestamp_fields)}}
+
+
+def _list_version(values, timestamp_fields):
+    timestamps = [values[f'last_{i}'] for i in range(len(timestamp_fields))]
+    return make_version(values['count'], *timestamps), latest(*timestamps)
+
+
+def list_validators(queryset, *timestamp_fields):
+    """
+    (version, last_modified) for a list: COUNT plus MAX() of each timestamp
+    field, computed in one aggregate query
+    """
+    values = queryset.order_by().aggregate(**_list_aggregates(timestamp_fields))
+    return _list_version(values, timestamp_fields)
+
+
+async def alist_validators(queryset, *timestamp_fields):
+    values = await queryset.order_by().aaggregate(**_list_aggregates(timestamp_fields))
+    return _list_version(values, timestamp_fields)
+
+
+def row_validators(queryset, *timestamp_fields):
+    """
+    (version, last_modified) for a single row, or None when it does not exist
+    """
+    try:
+        row = queryset.order_by().values_list(*timestamp_fields).first()
+    except (TypeError, ValueError, ValidationError):
+        # Malformed lookup value: let the handler answer with its usual 404
+        return None
+    if row is None:
+        return None
+    return make_version(*row), latest(*row)
+
+
+async def arow_validators(queryset, *timestamp_fields):
+    try:
+        row = await queryset.order_by().values_list(*timestamp_fields).afirst()
+    except (TypeError, ValueError, ValidationError):
+        return None
+    if row is None:
+        return None
+    return make_version(*row), latest(*row)
@@ -0,0 +1,351 @@
+import copy
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .sparse import SparseFieldsMixin
+
+# Compiled plans kept per (serializer class, compact, sparse fieldset)
+MAX_PLANS = 256
+
+# Fields whose to_representation() returns database values unchanged
+_IDENTITY_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.BooleanField,
+    serializers.ReadOnlyField,
+    serializers.PrimaryKeyRelatedField,
+)
+
+_plans = OrderedDict()
+_row_classes = {}
+
+
+def is_enabled():
+    return getattr(settings, 'FAST_SERIALIZATION', False)
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(branch)) for key, branch in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class _Children:
+    """
+    Rows of a many relation for one parent, as the model's related manager
+    would give them to a property (self.items.all())
+    """
+    __slots__ = ('rows',)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class _Row:
+    """
+    Stand-in for a model instance over a values() row, so computed fields
+    run the model's own properties (Product.is_available, Cart.total_price)
+    """
+    __slots__ = ('_row', '_prefix', '_fetched')
+    _relations = {}
+
+    def __init__(self, row, prefix='', fetched=None):
+        self._row = row
+        self._prefix = prefix
+        self._fetched = fetched
+
+    def __getattr__(self, name):
+        relation = self._relations.get(name)
+        if relation is None:
+            return self._row[self._prefix + name]
+        many, related_model = relation
+        if many:
+            child_plan, groups, child_fetched = self._fetched[name]
+            row_class = row_class_for(related_model)
+            return _Children([
+                row_class(child, '', child_fetched)
+                for child in groups.get(self._row[self._prefix + 'id'], ())
+            ])
+        return row_class_for(related_model)(self._row, f'{self._prefix}{name}__', self._fetched)
+
+
+def row_class_for(model):
+    row_class = _row_classes.get(model)
+    if row_class is None:
+        attrs = {name: value for name, value in vars(model).items() if isinstance(value, property)}
+        attrs['_relations'] = {
+            field.name: (field.one_to_many or field.many_to_many, field.related_model)
+            for field in model._meta.get_fields()
+            if field.is_relation and field.related_model is not None
+        }
+        attrs['__slots__'] = ()
+        row_class = _row_classes[model] = type(f'{model.__name__}Row', (_Row,), attrs)
+    return row_class
+
+
+class Plan:
+    """
+    Field plan for one serializer: the values() lookups to read and, per
+    output field, a function building its value from a row. Many relations
+    are read with one extra values() query each.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = []
+        self.entries = []
+        # relation -> [foreign key name on the child, child Plan or None, extra columns]
+        self.children = {}
+
+    def add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+
+    def child(self, relation):
+        field = self.model._meta.get_field(relation)
+        if not field.one_to_many:
+            return None
+        return self.children.setdefault(relation, [field.field.name, None, []])
+
+    def values(self, queryset, *extra):
+        columns = list(dict.fromkeys([*self.columns, *extra]))
+        return queryset.prefetch_related(None).values(*columns)
+
+    def fetch(self, rows):
+        """
+        Read the many-related rows of the given rows, grouped by parent id
+        """
+        fetched = {}
+        ids = [row['id'] for row in rows] if self.children else ()
+        for relation, (foreign_key, child, extra) in self.children.items():
+            groups = defaultdict(list)
+            child_fetched = {}
+            if ids:
+                child_rows = list(
+                    child.model.objects.filter(**{f'{foreign_key}__in': ids})
+                    .order_by('pk')
+                    .values(foreign_key, *dict.fromkeys([*child.columns, *extra]))
+                )
+                for child_row in child_rows:
+                    groups[child_row[foreign_key]].append(child_row)
+                child_fetched = child.fetch(child_rows)
+            fetched[relation] = (child, groups, child_fetched)
+        return fetched
+
+    def build(self, rows, request=None):
+        rows = list(rows)
+        fetched = self.fetch(rows)
+        return [self.build_row(row, fetched, request) for row in rows]
+
+    def build_row(self, row, fetched, request):
+        return {name: entry(row, fetched, request) for name, entry in self.entries}
+
+
+def _scalar(key, convert):
+    if convert is None:
+        return lambda row, fetched, request: row[key]
+
+    def entry(row, fetched, request):
+        value = row[key]
+        return None if value is None else convert(value)
+    return entry
+
+
+def _file(key, model_field, use_url):
+    storage = model_field.storage
+
+    def entry(row, fetched, request):
+        name = row[key]
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return entry
+
+
+def _computed(getter, row_class, prefix):
+    def entry(row, fetched, request):
+        return getter(row_class(row, prefix, fetched))
+    return entry
+
+
+def _nested(key, entries):
+    def entry(row, fetched, request):
+        if row[key] is None:
+            return None
+        return {name: build(row, fetched, request) for name, build in entries}
+    return entry
+
+
+def _many(relation):
+    def entry(row, fetched, request):
+        child, groups, child_fetched = fetched[relation]
+        return [child.build_row(child_row, child_fetched, request) for child_row in groups.get(row['id'], ())]
+    return entry
+
+
+def _compile_fields(plan, serializer, model, prefix):
+    """
+    Entries for the serializer's fields, reading plan columns under prefix.
+    None when a field cannot be built from values() rows.
+    """
+    entries = []
+    sources = getattr(serializer.Meta, 'field_sources', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        source = field.source
+        if source == '*' or '.' in source:
+            return None
+
+        if name in sources:
+            getter = getattr(model, source, None)
+            if not isinstance(getter, property):
+                return None
+            for path in sources[name]:
+                relation, _, rest = path.partition('__')
+                if rest and model._meta.get_field(relation).one_to_many:
+                    # Through a many relation: read by the child query
+                    if prefix:
+                        return None
+                    plan.child(relation)[2].append(rest)
+                else:
+                    plan.add_column(prefix + path)
+            entries.append((name, _computed(getter.fget, row_class_for(model), prefix)))
+            continue
+
+        if isinstance(field, serializers.ListSerializer):
+            if prefix or not isinstance(field.child, SparseFieldsMixin):
+                return None
+            child = plan.child(source)
+            if child is None:
+                return None
+            child_plan = compile_plan(field.child)
+            if child_plan is None:
+                return None
+            child[1] = child_plan
+            entries.append((name, _many(source)))
+            continue
+
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            return None
+        key = prefix + source
+
+        if isinstance(field, serializers.BaseSerializer):
+            if not isinstance(field, SparseFieldsMixin) or not (model_field.many_to_one or model_field.one_to_one):
+                return None
+            plan.add_column(key)
+            nested = _compile_fields(plan, field, model_field.related_model, f'{key}__')
+            if nested is None:
+                return None
+            entries.append((name, _nested(key, nested)))
+            continue
+
+        if not model_field.concrete:
+            return None
+        plan.add_column(key)
+        if isinstance(field, serializers.FileField):
+            use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+            entries.append((name, _file(key, model_field, use_url)))
+        elif isinstance(field, _IDENTITY_FIELDS):
+            entries.append((name, _scalar(key, None)))
+        else:
+            # An unbound copy, so the cached plan holds no request
+            entries.append((name, _scalar(key, copy.deepcopy(field).to_representation)))
+    return entries
+
+
+def compile_plan(serializer):
+    """
+    Plan for a serializer instance whose fields are already resolved
+    (sparse fieldsets applied), or None if it cannot be built from rows
+    """
+    plan = Plan(serializer.Meta.model)
+    entries = _compile_fields(plan, serializer, plan.model, '')
+    if entries is None:
+        return None
+    if plan.children:
+        plan.add_column('id')
+    for relation, child in plan.children.items():
+        if child[1] is None:
+            # Only read for computed fields
+            child[1] = Plan(plan.model._meta.get_field(relation).related_model)
+    plan.entries = entries
+    return plan
+
+
+def get_plan(serializer):
+    """
+    Compiled plan for a serializer (or ListSerializer), cached per serializer
+    class and requested shape so the field machinery runs once per shape
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    if not isinstance(serializer, SparseFieldsMixin):
+        return None
+
+    key = (type(serializer), serializer.is_compact(), _freeze(serializer.get_sparse()))
+    try:
+        _plans.move_to_end(key)
+        return _plans[key]
+    except KeyError:
+        pass
+    plan = _plans[key] = compile_plan(serializer)
+    if len(_plans) > MAX_PLANS:
+        _plans.popitem(last=False)
+    return plan
+
+
+def serialize(queryset, serializer, *extra):
+    """
+    Serialize the queryset's rows the way serializer would, or return None
+    when it has no compiled plan (fall back to serializer.data)
+    """
+    plan = get_plan(serializer)
+    if plan is None:
+        return None
+    return plan.build(plan.values(queryset, *extra), serializer.context.get('request'))
+
+
+class FastListMixin:
+    """
+    Serve list actions from compiled plans when FAST_SERIALIZATION is on;
+    pagination runs on the values() rows
+    """
+    fast_actions = ('list',)
+
+    def use_fast_serialization(self):
+        return is_enabled() and self.action in self.fast_actions
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serialization():
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.get_serializer(many=True)
+        plan = get_plan(serializer)
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        extra = ['id']
+        timestamp_field = getattr(self.paginator, 'timestamp_field', None)
+        if timestamp_field:
+            extra.append(timestamp_field)
+        rows = plan.values(self.filter_queryset(self.get_queryset()), *extra)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.build(page, request))
+        return Response(plan.build(rows, request))
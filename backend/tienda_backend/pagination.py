@@ -0,0 +1,223 @@
+import base64
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+async def apaginate_queryset(paginator, queryset, request):
+    """
+    PageNumberPagination.paginate_queryset() for async views: the same page
+    and links, with the count and the rows read through the async ORM
+    """
+    paginator.request = request
+    page_size = paginator.get_page_size(request)
+    if not page_size:
+        return None
+
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    # Paginator.count is a cached property: fill it so page() runs no query
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+    if django_paginator.num_pages > 1 and paginator.template is not None:
+        paginator.display_page_controls = True
+    paginator.page.object_list = [item async for item in paginator.page.object_list]
+    return list(paginator.page)
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination by default, keyset (cursor) pagination on demand.
+
+    Sending ?cursor= (empty for the first page) switches the list to keyset mode:
+    rows are ordered newest first on (timestamp, id) and each page is fetched with
+    a range condition on that pair, so no COUNT(*) or OFFSET is ever executed and
+    every page costs the same as the first one. ?count=approx adds an estimated
+    total that never scans the whole table.
+    """
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    timestamp_field = 'created_at'
+    keyset_actions = ('list',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    # Estimated counts above this value are reported as the cap itself
+    approximate_count_cap = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(request, view)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        position, reverse = self.start_keyset(request)
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.approximate_count = self.estimate_count(queryset.order_by())
+        queryset = self.keyset_queryset(queryset, position, reverse)
+        return self.keyset_page(list(queryset[:self.page_size_value + 1]), position, reverse)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        paginate_queryset() for async views, reading rows with the async ORM
+        """
+        self.keyset = self.use_keyset(request, view)
+        if not self.keyset:
+            return await apaginate_queryset(self, queryset, request)
+
+        position, reverse = self.start_keyset(request)
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.approximate_count = await sync_to_async(self.estimate_count)(queryset.order_by())
+        queryset = self.keyset_queryset(queryset, position, reverse)
+        results = [item async for item in queryset[:self.page_size_value + 1]]
+        return self.keyset_page(results, position, reverse)
+
+    def use_keyset(self, request, view):
+        return (
+            self.cursor_query_param in request.query_params
+            and getattr(view, 'action', None) in self.keyset_actions
+        )
+
+    def start_keyset(self, request):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.approximate_count = None
+        return self.decode_cursor(request)
+
+    def keyset_queryset(self, queryset, position, reverse):
+        field = self.timestamp_field
+        if reverse:
+            queryset = queryset.order_by(field, 'id')
+        else:
+            queryset = queryset.order_by(f'-{field}', '-id')
+
+        if position is not None:
+            timestamp, pk = position
+            if reverse:
+                queryset = queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'id__gt': pk}))
+            else:
+                queryset = queryset.filter(Q(**{f'{field}__lt': timestamp}) | Q(**{field: timestamp, 'id__lt': pk}))
+        return queryset
+
+    def keyset_page(self, results, position, reverse):
+        """
+        Trim the page_size + 1 rows read to the page and set the link state
+        """
+        has_more = len(results) > self.page_size_value
+        results = results[:self.page_size_value]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.first_item = results[0] if results else None
+        self.last_item = results[-1] if results else None
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.approximate_count is not None:
+            payload['approximate_count'] = self.approximate_count
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['approximate_count'] = {'type': 'integer', 'example': 123}
+        return response_schema
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or self.last_item is None:
+            return None
+        return self.build_link(self.last_item, reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or self.first_item is None:
+            return None
+        return self.build_link(self.first_item, reverse=True)
+
+    def build_link(self, item, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(item, reverse))
+
+    def encode_cursor(self, item, reverse):
+        # item is a model instance, or a values() row on the fast serialization path
+        if isinstance(item, dict):
+            timestamp, pk = item[self.timestamp_field], item['id']
+        else:
+            timestamp, pk = getattr(item, self.timestamp_field), item.pk
+        data = {'p': [timestamp.isoformat(), pk]}
+        if reverse:
+            data['r'] = 1
+        raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        """
+        Return ((timestamp, id) or None, reverse) from the opaque cursor parameter
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            raw_timestamp, pk = data['p']
+            timestamp = parse_datetime(raw_timestamp)
+            pk = int(pk)
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return (timestamp, pk), bool(data.get('r'))
+
+    def estimate_count(self, queryset):
+        """
+        Cheap row estimate: the planner's estimate on PostgreSQL,
+        a count bounded by approximate_count_cap everywhere else.
+        """
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+        return queryset[:self.approximate_count_cap].count()
+
+
+class UserKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination for django.contrib.auth users, keyed on (date_joined, id)
+    """
+    timestamp_field = 'date_joined'
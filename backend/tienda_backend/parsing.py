@@ -0,0 +1,14 @@
+def parse_int(value):
+    """
+    Return value (a number or a string, as JSON bodies and CSV cells carry
+    them) as an int, or None when it is not a whole number. Booleans and
+    fractions are rejected rather than coerced, as int() would do.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float) and not value.is_integer():
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
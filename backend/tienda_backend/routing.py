@@ -0,0 +1,173 @@
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_KEY_PREFIX = 'db:pin:'
+
+_state = ContextVar('database_routing', default=None)
+
+
+class RequestState:
+    __slots__ = ('replica', 'wrote')
+
+    def __init__(self):
+        # Reads may go to a replica
+        self.replica = False
+        # A write was routed to the primary during the request
+        self.wrote = False
+
+
+def _database(alias):
+    config = connections[alias].settings_dict
+    return config['ENGINE'], str(config['NAME']), config['HOST'], config['PORT']
+
+
+def get_replicas():
+    """
+    Replica aliases, leaving out those that are the primary's own database
+    (test mirrors), which would only be a second connection to it
+    """
+    replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+    if not replicas:
+        return []
+    primary = _database(DEFAULT_DB_ALIAS)
+    return [alias for alias in replicas if _database(alias) != primary]
+
+
+def get_pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def get_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def pin_key(user):
+    return f'{PIN_KEY_PREFIX}{user.pk}'
+
+
+def is_pinned(user):
+    return bool(user and user.is_authenticated and get_cache().get(pin_key(user)))
+
+
+async def ais_pinned(user):
+    return bool(user and user.is_authenticated and await get_cache().aget(pin_key(user)))
+
+
+def use_replica():
+    state = _state.get()
+    if state is not None and not state.wrote and get_replicas():
+        state.replica = True
+
+
+def use_primary():
+    state = _state.get()
+    if state is not None:
+        state.replica = False
+
+
+class ReplicaRouter:
+    """
+    Send reads to a replica only while the current request allows it (see
+    ReplicaReadMixin); everything else, writes and select_for_update()
+    included, goes to the primary. The first write of a request routes the
+    rest of it to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.replica:
+            replicas = get_replicas()
+            if replicas:
+                return random.choice(replicas)
+        # Default routing: the database of the instance hint, or the primary
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.replica = False
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *getattr(settings, 'DATABASE_REPLICAS', [])}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary, not migrated on their own
+        if db in getattr(settings, 'DATABASE_REPLICAS', []):
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Scope routing state to each request. A user whose request wrote is
+    pinned to the primary for REPLICA_PIN_SECONDS, so the next reads see
+    the write (read-your-writes) even if replicas lag behind.
+    Runs natively under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RequestState()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        state = RequestState()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote:
+            # request.user may still be the lazy session user, which loads synchronously
+            await sync_to_async(self.pin)(request)
+        return response
+
+    def pin(self, request):
+        user = getattr(request, 'user', None)
+        if get_replicas() and user is not None and user.is_authenticated:
+            get_cache().set(pin_key(user), 1, get_pin_seconds())
+
+
+class ReplicaReadMixin:
+    """
+    Let the read-only actions in replica_actions read from a replica, unless
+    the user wrote in the last REPLICA_PIN_SECONDS
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if (
+            get_replicas()
+            and request.method in SAFE_METHODS
+            and self.action in self.replica_actions
+            and not is_pinned(request.user)
+        ):
+            use_replica()
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_config, replica_configs
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,16 +52,21 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'tienda_backend.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tienda_backend.routing.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'tienda_backend.urls'
+# Opt-in: ASGI deployments serve the catalog reads from async views; "python manage.py benchmark_catalog_load" compares WSGI and ASGI
+ASYNC_CATALOG = os.environ.get('ASYNC_CATALOG', '').lower() in ('1', 'true', 'yes')
+
+ROOT_URLCONF = 'tienda_backend.asgi_urls' if ASYNC_CATALOG else 'tienda_backend.urls'
 
 TEMPLATES = [
     {
@@ -80,14 +88,62 @@ WSGI_APPLICATION = 'tienda_backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Built from DATABASE_URL (sqlite:///db.sqlite3 by default). SQLite runs in
+# WAL mode with tuned pragmas (SQLITE_* variables, SQLITE_TUNING=false for
+# Django's defaults); PostgreSQL keeps connections for DB_CONN_MAX_AGE
+# seconds or, with DB_POOL, uses a connection pool. See tienda_backend/database.py;
+# "python manage.py benchmark_db_writes" compares SQLite profiles.
 
 DATABASES = {
+    'default': database_config(base_dir=BASE_DIR),
+    **replica_configs(base_dir=BASE_DIR),
+}
+
+# Read replicas (DATABASE_REPLICA_URLS) serve the read-only catalog and order
+# history actions; writes, checkout and locking reads use the primary. A user
+# who wrote reads from the primary for REPLICA_PIN_SECONDS afterwards.
+# "python manage.py sync_replicas" copies an SQLite primary to SQLite replicas.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['tienda_backend.routing.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# In-process memory by default; point CACHE_BACKEND/CACHE_LOCATION at a shared
+# backend (file, Redis, Memcached) to share it between processes
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'tienda-cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Catalog responses (product/category lists and details) are cached for this
+# many seconds; product and category changes invalidate them immediately
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 300))
+
+# Users behind JWT tokens are cached for this many seconds, so authenticating
+# a request costs no query; saving or deleting a user invalidates its entry
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = int(os.environ.get('AUTH_USER_CACHE_TIMEOUT', 60))
+# Actions that only need the user id (the cart) skip the user lookup. With
+# auto that is only done when the cache above is shared between processes
+# (not locmem), since a deactivated or deleted user is only blocked there;
+# true forces it, for single-process deployments.
+_auth_claims_only = os.environ.get('AUTH_CLAIMS_ONLY', 'auto').lower()
+AUTH_CLAIMS_ONLY = None if _auth_claims_only == 'auto' else _auth_claims_only in ('1', 'true', 'yes')
+
+# Serve product/order lists and cart responses from compiled field plans over
+# values() rows instead of DRF's per-field machinery (same output);
+# "python manage.py benchmark_serializers" compares both
+FAST_SERIALIZATION = os.environ.get('FAST_SERIALIZATION', '').lower() in ('1', 'true', 'yes')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -107,6 +163,45 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# PBKDF2 as Django does it, with the iterations set per environment (lower in
+# development, higher on fast hardware; existing hashes are upgraded at login).
+# Login and registration hash on a pool of PASSWORD_HASHING_WORKERS workers
+# (0: on the request thread) with at most PASSWORD_HASHING_QUEUE hashes
+# waiting; beyond that they answer 429 at once instead of pinning every worker.
+# "python manage.py benchmark_login" measures login throughput by concurrency.
+PASSWORD_HASHERS = [
+    'users.hashing.PooledPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 1_000_000))
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+PASSWORD_HASHING_QUEUE = int(os.environ.get('PASSWORD_HASHING_QUEUE', 2 * PASSWORD_HASHING_WORKERS))
+# thread (hashlib releases the GIL while hashing) or process
+PASSWORD_HASHING_EXECUTOR = os.environ.get('PASSWORD_HASHING_EXECUTOR', 'thread')
+
+# Sliding-window limits for login (per client address and per username) and
+# registration (per address); a missing rate disables that limit
+AUTH_THROTTLE_RATES = {
+    'login_ip': os.environ.get('LOGIN_IP_RATE', '30/min'),
+    'login_username': os.environ.get('LOGIN_USERNAME_RATE', '10/min'),
+    'register_ip': os.environ.get('REGISTER_IP_RATE', '20/hour'),
+}
+
+# Bulk provisioning: POST /api/users/provision/ (staff) hashes on the sign-in
+# pool above, on one slot per worker, and answers 429 when it is saturated.
+# USER_PROVISIONING_MAX_USERS keeps a request within the request timeout
+# (about 0.25 s per hash and worker at 1,000,000 iterations); "python
+# manage.py provision_users", for larger loads, hashes on its own pool of
+# USER_PROVISIONING_WORKERS
+USER_PROVISIONING_WORKERS = int(os.environ.get('USER_PROVISIONING_WORKERS', os.cpu_count() or 1))
+# process (started with spawn) or thread
+USER_PROVISIONING_EXECUTOR = os.environ.get('USER_PROVISIONING_EXECUTOR', 'process')
+USER_PROVISIONING_MAX_USERS = int(os.environ.get('USER_PROVISIONING_MAX_USERS', 100))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -151,21 +246,38 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'tienda_backend.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # orjson when installed, DRF's stdlib json otherwise; same output either way
+    'DEFAULT_RENDERER_CLASSES': [
+        'tienda_backend.fast_json.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'tienda_backend.fast_json.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Compress API responses of at least API_COMPRESSION_MIN_SIZE bytes with
+# brotli (if the "brotli" package is installed) or gzip
+API_COMPRESSION = os.environ.get('API_COMPRESSION', '').lower() in ('1', 'true', 'yes')
+API_COMPRESSION_MIN_SIZE = int(os.environ.get('API_COMPRESSION_MIN_SIZE', 1024))
+API_COMPRESSION_BROTLI_QUALITY = 5
+
 # Simple JWT settings
 from datetime import timedelta
 
@@ -199,8 +311,41 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
+
+    # Blacklist checks go through an in-memory filter (users.tokens)
+    'TOKEN_REFRESH_SERIALIZER': 'users.tokens.FilteredTokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'users.tokens.FilteredTokenVerifySerializer',
 }
 
+# Refresh and verify only query the token blacklist for tokens a per-process
+# Bloom filter cannot rule out (about 1 in 1000 of the others). The filter is
+# rebuilt in the background every TOKEN_BLACKLIST_FILTER_REBUILD seconds;
+# other processes' entries are read from the database, when the shared cache
+# says there are new ones, at most every TOKEN_BLACKLIST_FILTER_SYNC seconds
+# (0: on every check). With auto the filter is only used when that cache is
+# shared between processes (not locmem); true forces it, for single-process
+# deployments. Run "python manage.py purge_expired_tokens" periodically to
+# delete expired outstanding and blacklisted tokens.
+_token_blacklist_filter = os.environ.get('TOKEN_BLACKLIST_FILTER', 'auto').lower()
+TOKEN_BLACKLIST_FILTER = None if _token_blacklist_filter == 'auto' else _token_blacklist_filter in ('1', 'true', 'yes')
+TOKEN_BLACKLIST_FILTER_ERROR_RATE = 0.001
+TOKEN_BLACKLIST_FILTER_REBUILD = int(os.environ.get('TOKEN_BLACKLIST_FILTER_REBUILD', 3600))
+TOKEN_BLACKLIST_FILTER_SYNC = float(os.environ.get('TOKEN_BLACKLIST_FILTER_SYNC', 1.0))
+TOKEN_BLACKLIST_CACHE_ALIAS = 'default'
+
+# Cart settings
+# Stock held for a cart line stays reserved this long after the last change;
+# run "python manage.py release_expired_reservations" periodically to free it
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
+# Responses stored for requests sent with an Idempotency-Key header are
+# replayed to retries for this long ("python manage.py purge_idempotency_keys")
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# A request still unfinished after this long is presumed dead (its worker
+# was killed) and a retry runs it again. The action and its outcome commit
+# together, so if the first request was only slow it rolls back with a 409.
+IDEMPOTENCY_KEY_LEASE = timedelta(seconds=60)
+
 # Swagger settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -0,0 +1,192 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+EXPAND_PARAM = 'expand'
+
+
+def parse_paths(value):
+    """
+    Turn "id,name,product.name,product.category" into a tree of nested dicts:
+    {'id': {}, 'name': {}, 'product': {'name': {}, 'category': {}}}
+    """
+    if isinstance(value, dict):
+        return value
+    tree = {}
+    if isinstance(value, str):
+        value = value.split(',')
+    for path in value or ():
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets for model serializers.
+
+    ?fields= keeps only the listed fields, ?exclude= drops fields and
+    ?expand= turns an expandable relation into its nested representation
+    (on reads: writes validate and return every field);
+    dotted paths reach nested serializers (?fields=items.product.name,
+    ?expand=items.product.category). The root serializer reads them from the
+    request and hands each nested serializer its own branch.
+
+    In list and nested contexts the representation defaults to
+    Meta.compact_fields, with Meta.expandable_fields collapsed to their id.
+    Meta.field_sources maps computed fields to the model fields they read,
+    which get_query_plan() uses to tell the view which columns to load.
+    """
+
+    def __init__(self, *args, **kwargs):
+        spec = [kwargs.pop(name, None) for name in (FIELDS_PARAM, EXCLUDE_PARAM, EXPAND_PARAM)]
+        self.compact = kwargs.pop('compact', None)
+        super().__init__(*args, **kwargs)
+        self.sparse = None if spec == [None, None, None] else tuple(parse_paths(value) for value in spec)
+
+    def get_sparse(self):
+        """
+        (fields, exclude, expand) trees: set by the parent serializer, passed
+        as arguments, or read from the query string by the root serializer.
+        Writes ignore the query string: the fields a sparse fieldset drops
+        would be dropped from the input too.
+        """
+        if self.sparse is not None:
+            return self.sparse
+        request = self.context.get('request')
+        parent = self.parent
+        is_root = parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+        if request is None or not is_root or request.method not in SAFE_METHODS:
+            return {}, {}, {}
+        params = getattr(request, 'query_params', request.GET)
+        return tuple(
+            parse_paths(params.get(name, '')) for name in (FIELDS_PARAM, EXCLUDE_PARAM, EXPAND_PARAM)
+        )
+
+    def is_compact(self):
+        if self.compact is not None:
+            return self.compact
+        # Items of a list, or nested in another serializer
+        return self.parent is not None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        only, exclude, expand = self.get_sparse()
+        meta = self.Meta
+        compact = self.is_compact()
+
+        if only:
+            keep = set(only)
+        elif compact and getattr(meta, 'compact_fields', None):
+            keep = set(meta.compact_fields) | set(expand)
+        else:
+            keep = set(fields)
+        # Write-only fields are input, sparse fieldsets only shape the output
+        keep = {name for name in keep if name in fields} | {
+            name for name, field in fields.items() if field.write_only
+        }
+        keep -= {name for name, branch in exclude.items() if not branch}
+
+        for name in list(fields):
+            if name not in keep:
+                del fields[name]
+                continue
+
+            field = fields[name]
+            if name in getattr(meta, 'expandable_fields', ()) and compact and name not in expand:
+                source = {} if field.source in (None, name) else {'source': field.source}
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, **source)
+                continue
+
+            nested = field.child if isinstance(field, serializers.ListSerializer) else field
+            if isinstance(nested, SparseFieldsMixin) and nested.sparse is None:
+                nested.sparse = (only.get(name, {}), exclude.get(name, {}), expand.get(name, {}))
+        return fields
+
+    def get_query_plan(self):
+        """
+        Model field paths this representation reads, for QuerySet.only(),
+        following to-one nested serializers. None when a field reads
+        something that cannot be mapped to columns.
+        """
+        model = self.Meta.model
+        sources = getattr(self.Meta, 'field_sources', {})
+        columns = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in sources:
+                # Paths through many relations are read by the prefetch
+                columns.extend(
+                    path for path in sources[name]
+                    if not model._meta.get_field(path.split('__')[0]).one_to_many
+                )
+                continue
+            if field.source == '*' or '.' in field.source:
+                return None
+            if isinstance(field, SparseFieldsMixin):
+                nested_columns = field.get_query_plan()
+                if nested_columns is None:
+                    return None
+                columns.append(field.source)
+                columns.extend(f'{field.source}__{column}' for column in nested_columns)
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                # Many-related rows come from a prefetch, not from these columns
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                return None
+            try:
+                model._meta.get_field(field.source)
+            except FieldDoesNotExist:
+                return None
+            columns.append(field.source)
+        return list(dict.fromkeys(columns))
+
+
+def related_paths(columns):
+    """
+    Relations to select_related() for the given only() column paths
+    """
+    paths = set()
+    for column in columns:
+        parts = column.split('__')[:-1]
+        paths.update('__'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return sorted(paths)
+
+
+def only_emitted(queryset, serializer, extra=()):
+    """
+    Restrict a queryset to the columns (and joins) the serializer emits.
+    Relations are only joined when they are serialized; the queryset is
+    returned unchanged when the serializer cannot tell what it reads.
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    columns = serializer.get_query_plan()
+    if columns is None:
+        return queryset
+    columns = [*columns, *extra]
+    queryset = queryset.select_related(None)
+    related = related_paths(columns)
+    if related:
+        # select_related() without arguments would follow every relation
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def nested_columns(serializer, name):
+    """
+    only() columns for the rows behind a many=True nested field, or None
+    when the field is not emitted or cannot be planned
+    """
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    field = serializer.fields.get(name)
+    if not isinstance(field, serializers.ListSerializer) or not isinstance(field.child, SparseFieldsMixin):
+        return None
+    return field.child.get_query_plan()
@@ -0,0 +1,155 @@
+import base64
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.crypto import pbkdf2
+from django.utils.encoding import force_bytes
+
+EXECUTORS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+_offloaded = ContextVar('password_hashing_offloaded', default=False)
+
+
+class HashingBusy(Exception):
+    """
+    Every hashing worker is busy and the queue is full
+    """
+
+
+class HashingPool:
+    """
+    A fixed number of workers for password hashes, and at most queue_size
+    hashes waiting for one: submit() raises HashingBusy beyond that instead
+    of queueing more requests behind a burst
+    """
+
+    def __init__(self, workers, queue_size, executor='thread'):
+        self.workers = workers
+        self.executor = EXECUTORS[executor](max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def submit(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy
+        return self._start(fn, args, self.slots.release)
+
+    def map(self, fn, calls):
+        """
+        [fn(*args) for args in calls], computed in parallel with at most one
+        call per worker holding a slot at a time, so sign-ins keep the
+        queue. Raises HashingBusy when the first call gets no slot; later
+        ones wait for a slot (this map's own calls are freeing them).
+        """
+        window = threading.Semaphore(self.workers)
+
+        def release():
+            self.slots.release()
+            window.release()
+
+        futures = []
+        for args in calls:
+            window.acquire()
+            if not self.slots.acquire(blocking=bool(futures)):
+                window.release()
+                raise HashingBusy
+            futures.append(self._start(fn, args, release))
+        return [future.result() for future in futures]
+
+    def _start(self, fn, args, release):
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            release()
+            raise
+        future.add_done_callback(lambda _: release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_workers():
+    return getattr(settings, 'PASSWORD_HASHING_WORKERS', 1)
+
+
+def get_pool():
+    """
+    The process's hashing pool, or None when PASSWORD_HASHING_WORKERS is 0
+    (hash on the request thread)
+    """
+    global _pool
+    if get_workers() <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    get_workers(),
+                    getattr(settings, 'PASSWORD_HASHING_QUEUE', 0),
+                    getattr(settings, 'PASSWORD_HASHING_EXECUTOR', 'thread'),
+                )
+    return _pool
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    global _pool
+    if setting.startswith('PASSWORD_HASHING_') and _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+@contextmanager
+def offloaded():
+    """
+    Run the password hashes of the block (authenticate(), create_user()...)
+    on the hashing pool; HashingBusy when it is saturated
+    """
+    token = _offloaded.set(True)
+    try:
+        yield
+    finally:
+        _offloaded.reset(token)
+
+
+def pbkdf2_b64(password, salt, iterations, digest_name):
+    # Module level, so process pools can pickle it
+    digest = getattr(hashlib, digest_name)
+    return base64.b64encode(pbkdf2(password, salt, iterations, digest=digest)).decode('ascii').strip()
+
+
+class PooledPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 (SHA256) hasher, with PASSWORD_HASH_ITERATIONS iterations
+    for new hashes, that computes inside offloaded() blocks on the hashing
+    pool. Hashes are the same as PBKDF2PasswordHasher's, with the same name.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
+    def encode(self, password, salt, iterations=None):
+        self._check_encode_args(password, salt)
+        iterations = iterations or self.iterations
+        args = (force_bytes(password), force_bytes(salt), iterations, self.digest().name)
+        pool = get_pool() if _offloaded.get() else None
+        hash = pool.run(pbkdf2_b64, *args) if pool is not None else pbkdf2_b64(*args)
+        return '%s$%d$%s$%s' % (self.algorithm, iterations, salt, hash)
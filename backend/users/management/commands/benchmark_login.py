@@ -0,0 +1,123 @@
+import io
+import json
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+
+from products.management.commands.benchmark_catalog_load import HOST, percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure login throughput by concurrency with password hashing on the '
+        'request threads (inline) and on the hashing pool, and the latency of '
+        'catalog requests served meanwhile. Creates a temporary user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16, help='Highest number of concurrent logins')
+        parser.add_argument('--seconds', type=float, default=3.0, help='Duration per run')
+        parser.add_argument('--iterations', type=int, help='PBKDF2 iterations (default: PASSWORD_HASH_ITERATIONS)')
+        parser.add_argument('--mode', choices=['inline', 'pool'], action='append', help='Default: both')
+        parser.add_argument('--catalog-path', default='/api/categories/', help='Read in parallel with the logins')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations'] or settings.PASSWORD_HASH_ITERATIONS
+        password = uuid.uuid4().hex
+        overrides = {'DEBUG': False, 'AUTH_THROTTLE_RATES': {}, 'PASSWORD_HASH_ITERATIONS': iterations}
+        with override_settings(**overrides):
+            user = User.objects.create_user(username=f'benchmark-login-{uuid.uuid4().hex[:8]}', password=password)
+        body = json.dumps({'username': user.username, 'password': password}).encode()
+
+        levels = []
+        level = 1
+        while level < options['concurrency']:
+            levels.append(level)
+            level *= 2
+        levels.append(options['concurrency'])
+
+        self.stdout.write(
+            f'{"mode":<8}{"clients":>8}{"logins/s":>10}{"p50 ms":>10}{"429":>8}{"catalog p99 ms":>16}'
+        )
+        try:
+            for mode in options['mode'] or ['inline', 'pool']:
+                workers = 0 if mode == 'inline' else settings.PASSWORD_HASHING_WORKERS
+                with override_settings(PASSWORD_HASHING_WORKERS=workers, **overrides):
+                    handler = WSGIHandler()
+                    for clients in levels:
+                        logins, rejected, catalog = self.run(handler, body, clients, options)
+                        self.stdout.write(
+                            f'{mode:<8}{clients:>8}{len(logins) / options["seconds"]:>10.1f}'
+                            f'{percentile(logins, 0.5) * 1000:>10.0f}{rejected:>8}'
+                            f'{percentile(catalog, 0.99) * 1000:>16.1f}'
+                        )
+        finally:
+            user.delete()
+            connections.close_all()
+
+    def run(self, handler, body, clients, options):
+        deadline = time.monotonic() + options['seconds']
+        logins, catalog, rejected = [], [], [0]
+
+        def login():
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    status = self.request(handler, 'POST', '/api/users/login/', body)
+                    if status == 429:
+                        rejected[0] += 1
+                        # A client backing off as told by Retry-After, shortened
+                        time.sleep(0.05)
+                    else:
+                        logins.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        def read_catalog():
+            try:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    self.request(handler, 'GET', options['catalog_path'])
+                    catalog.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=login) for _ in range(clients)]
+        threads.append(threading.Thread(target=read_catalog))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return logins, rejected[0], catalog
+
+    def request(self, handler, method, path, body=b''):
+        status = []
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': HOST,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': HOST,
+            'HTTP_ACCEPT': 'application/json',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': io.StringIO(),
+            'wsgi.url_scheme': 'http',
+        }
+        response = handler(environ, lambda code, headers: status.append(code))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        return int(status[0].split()[0])
@@ -0,0 +1,73 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.provisioning import provision_users
+from users.serializers import UserProvisionSerializer
+
+# Keys of the QA data files (Test_profe/crear_usuarios/data.json)
+ALIASES = {'mail': 'email', 'nombre': 'first_name', 'apellido': 'last_name'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Create users in bulk from a JSON list (username, password, email, first_name, '
+        'last_name, profile; the keys of the QA data files work too) or, with --count, '
+        'numbered load-test users, hashing passwords in parallel'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help='JSON file with a list of users')
+        parser.add_argument('--count', type=int, help='Generate this many users instead of reading a file')
+        parser.add_argument('--prefix', default='loadtest', help='Username prefix of generated users')
+        parser.add_argument('--password', default='loadtest-pass-123', help='Password of generated users')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, help='Hashing workers (default: USER_PROVISIONING_WORKERS)')
+        parser.add_argument(
+            '--iterations', type=int,
+            help='PBKDF2 iterations (default: PASSWORD_HASH_ITERATIONS). Lower for load-test '
+                 'accounts; their hashes are upgraded at first login.',
+        )
+        parser.add_argument('--tokens', metavar='FILE', help='Write a JSON line with tokens per created user')
+
+    def handle(self, *args, **options):
+        if options['count']:
+            rows = [
+                {'username': f'{options["prefix"]}{i:06d}', 'password': options['password']}
+                for i in range(options['count'])
+            ]
+        elif options['file']:
+            rows = self.read(options['file'])
+        else:
+            raise CommandError('Give a JSON file or --count')
+
+        start = time.perf_counter()
+        created, skipped = provision_users(
+            rows,
+            batch_size=options['batch_size'],
+            tokens=bool(options['tokens']),
+            iterations=options['iterations'],
+            workers=options['workers'],
+        )
+        elapsed = time.perf_counter() - start
+
+        if options['tokens']:
+            with open(options['tokens'], 'w') as output:
+                for entry in created:
+                    output.write(json.dumps(entry) + '\n')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(created)} users ({len(skipped)} skipped) in {elapsed:.1f}s '
+            f'with {options["workers"] or settings.USER_PROVISIONING_WORKERS} hashing workers'
+        ))
+
+    def read(self, path):
+        with open(path) as source:
+            data = json.load(source)
+        rows = [{ALIASES.get(key, key): value for key, value in row.items()} for row in data]
+        serializer = UserProvisionSerializer(data=rows, many=True)
+        if not serializer.is_valid():
+            errors = {index: error for index, error in enumerate(serializer.errors) if error}
+            raise CommandError(f'Invalid users: {errors}')
+        return serializer.validated_data
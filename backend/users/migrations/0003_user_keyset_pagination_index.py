@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-16 20:52
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0002_auto_20250818_1924'),
+    ]
+
+    operations = [
+        # auth.User belongs to django.contrib.auth, so the index backing
+        # keyset pagination on (date_joined, id) is created with plain SQL
+        migrations.RunSQL(
+            sql='CREATE INDEX user_joined_id_idx ON auth_user (date_joined, id);',
+            reverse_sql='DROP INDEX user_joined_id_idx;',
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_user_profiles(apps, schema_editor):
+    # Profiles used to be created by a post_save signal on every new user;
+    # create the missing ones in bulk so existing users all keep one
+    User = apps.get_model('auth', 'User')
+    UserProfile = apps.get_model('users', 'UserProfile')
+    db = schema_editor.connection.alias
+
+    last_id = 0
+    while True:
+        ids = list(
+            User.objects.using(db)
+            .filter(id__gt=last_id, profile__isnull=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            return
+        UserProfile.objects.using(db).bulk_create([UserProfile(user_id=user_id) for user_id in ids])
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_user_keyset_pagination_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_user_profiles, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
 # Create your models here.
 
@@ -18,11 +19,37 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} Profile"
 
-@receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        UserProfile.objects.create(user=instance)
+
+def get_profile(user, create=True):
+    """
+    The user's profile. Profiles are created on first use, not with the user:
+    without one, get_or_create it, or (create=False) return a blank unsaved one
+    """
+    try:
+        return user.profile
+    except UserProfile.DoesNotExist:
+        if not create:
+            return UserProfile(user=user)
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        return profile
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+def forget_cached_user(sender, instance, **kwargs):
+    # Deactivated users must stop authenticating at once
+    from tienda_backend.authentication import block_user, forget_user
+    if instance.is_active:
+        forget_user(instance.pk)
+    else:
+        block_user(instance.pk)
+
+@receiver(post_delete, sender=User)
+def block_deleted_user(sender, instance, **kwargs):
+    from tienda_backend.authentication import block_user
+    block_user(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def remember_blacklisted_token(sender, instance, created, **kwargs):
+    if created:
+        from .tokens import token_blacklisted
+        token_blacklisted(instance.token.jti)
@@ -0,0 +1,163 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import repeat
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils.encoding import force_bytes
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .hashing import HashingPool, get_pool, pbkdf2_b64
+from .models import UserProfile
+
+USER_FIELDS = ('email', 'first_name', 'last_name')
+
+
+def get_workers():
+    return getattr(settings, 'USER_PROVISIONING_WORKERS', os.cpu_count() or 1)
+
+
+def get_executor():
+    return getattr(settings, 'USER_PROVISIONING_EXECUTOR', 'process')
+
+
+@contextmanager
+def hashing_executor(workers=None, executor=None):
+    """
+    A pool of `workers` processes (or threads) for hash_passwords(), shut down
+    on exit; None (hash inline) for a single worker. executor='shared' is
+    the sign-in hashing pool instead, for requests: it is bounded, and
+    raises HashingBusy when saturated.
+    """
+    if executor == 'shared':
+        yield get_pool()
+        return
+    workers = workers or get_workers()
+    if workers <= 1:
+        yield None
+        return
+    if (executor or get_executor()) == 'process':
+        # spawn: forking a server process that runs threads can deadlock the child
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+    else:
+        pool = ThreadPoolExecutor(workers)
+    with pool:
+        yield pool
+
+
+def hash_passwords(passwords, pool=None, iterations=None):
+    """
+    Password hashes for the default hasher, in order. PBKDF2 hashes are
+    computed on the pool (see hashing_executor()); other hashers hash one
+    by one.
+    """
+    hasher = get_hasher()
+    if not isinstance(hasher, PBKDF2PasswordHasher):
+        return [hasher.encode(password, hasher.salt()) for password in passwords]
+
+    iterations = iterations or hasher.iterations
+    salts = [hasher.salt() for _ in passwords]
+    args = (
+        [force_bytes(password) for password in passwords],
+        [force_bytes(salt) for salt in salts],
+        repeat(iterations),
+        repeat(hasher.digest().name),
+    )
+    if pool is None:
+        hashes = map(pbkdf2_b64, *args)
+    elif isinstance(pool, HashingPool):
+        hashes = pool.map(pbkdf2_b64, list(zip(*args)))
+    else:
+        # Chunks amortize the inter-process round trip of cheap hashes
+        hashes = pool.map(pbkdf2_b64, *args, chunksize=max(1, len(passwords) // 64))
+    return [
+        '%s$%d$%s$%s' % (hasher.algorithm, iterations, salt, hash)
+        for salt, hash in zip(salts, hashes)
+    ]
+
+
+def issue_tokens(users):
+    """
+    A refresh token for each user, recorded as outstanding with one bulk insert
+    """
+    # Token.for_user, skipping BlacklistMixin.for_user and its insert per token
+    tokens = [super(BlacklistMixin, RefreshToken).for_user(user) for user in users]
+    OutstandingToken.objects.bulk_create([
+        OutstandingToken(
+            user=user,
+            jti=token[api_settings.JTI_CLAIM],
+            token=str(token),
+            created_at=token.current_time,
+            expires_at=datetime_from_epoch(token['exp']),
+        )
+        for user, token in zip(users, tokens)
+    ])
+    return tokens
+
+
+def provision_users(rows, batch_size=1000, tokens=False, iterations=None, workers=None, executor=None):
+    """
+    Create users from rows of username, password and optionally email,
+    first_name, last_name and profile (a dict of UserProfile fields), with
+    their profiles. Each batch of batch_size rows is hashed in parallel and
+    inserted with one bulk insert per table, without signals. Usernames that
+    exist or repeat are skipped; a username taken concurrently makes its
+    batch fail with IntegrityError.
+
+    Returns (created, skipped): a dict per created user with id and
+    username (and refresh and access tokens when tokens), and the skipped
+    usernames.
+    """
+    created, skipped = [], []
+    seen = set()
+    with hashing_executor(workers, executor) as pool:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            existing = set(
+                User.objects.filter(username__in=[row['username'] for row in batch])
+                .values_list('username', flat=True)
+            )
+            new_rows = []
+            for row in batch:
+                if row['username'] in existing or row['username'] in seen:
+                    skipped.append(row['username'])
+                else:
+                    seen.add(row['username'])
+                    new_rows.append(row)
+            if not new_rows:
+                continue
+
+            hashes = hash_passwords([row['password'] for row in new_rows], pool, iterations)
+            users = [
+                User(username=row['username'], password=hash, **{name: row.get(name, '') for name in USER_FIELDS})
+                for row, hash in zip(new_rows, hashes)
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                if any(user.pk is None for user in users):
+                    # Backends that do not return ids from bulk inserts
+                    ids = dict(
+                        User.objects.filter(username__in=[user.username for user in users])
+                        .values_list('username', 'id')
+                    )
+                    for user in users:
+                        user.pk = ids[user.username]
+                UserProfile.objects.bulk_create([
+                    UserProfile(user=user, **row.get('profile', {}))
+                    for user, row in zip(users, new_rows)
+                ])
+                refresh_tokens = issue_tokens(users) if tokens else ()
+
+            for user in users:
+                created.append({'id': user.pk, 'username': user.username})
+            for entry, refresh in zip(created[-len(users):], refresh_tokens):
+                entry['refresh'] = str(refresh)
+                entry['access'] = str(refresh.access_token)
+    return created, skipped
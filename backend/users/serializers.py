@@ -1,14 +1,34 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import UserProfile
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from .models import UserProfile, get_profile
 
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
         fields = ['phone', 'address', 'city', 'postal_code', 'country']
+    
+    def update(self, instance, validated_data):
+        """
+        Save only the fields that changed, and nothing when none did
+        """
+        changed = [name for name, value in validated_data.items() if getattr(instance, name) != value]
+        for name in changed:
+            setattr(instance, name, validated_data[name])
+        if changed:
+            instance.save(update_fields=[*changed, 'updated_at'])
+        return instance
+
+class LazyProfileSerializer(UserProfileSerializer):
+    """
+    A user's profile, blank while it was never saved: reading it never creates it
+    """
+    def get_attribute(self, instance):
+        return get_profile(instance, create=False)
 
 class UserSerializer(serializers.ModelSerializer):
-    profile = UserProfileSerializer(read_only=True)
+    profile = LazyProfileSerializer(read_only=True)
     
     class Meta:
         model = User
@@ -32,3 +52,31 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         validated_data.pop('password_confirm')
         user = User.objects.create_user(**validated_data)
         return user
+
+
+class UserProvisionSerializer(serializers.ModelSerializer):
+    """
+    One account to provision. Usernames are not checked for uniqueness here
+    (a query per row): provision_users() skips the taken ones per batch.
+    """
+    profile = UserProfileSerializer(required=False)
+    
+    class Meta:
+        model = User
+        fields = ['username', 'email', 'password', 'first_name', 'last_name', 'profile']
+        extra_kwargs = {
+            'username': {'validators': [UnicodeUsernameValidator()]},
+            'password': {'write_only': True},
+        }
+
+class ProvisionSerializer(serializers.Serializer):
+    users = UserProvisionSerializer(many=True, allow_empty=False)
+    tokens = serializers.BooleanField(default=False)
+    
+    def validate_users(self, users):
+        limit = settings.USER_PROVISIONING_MAX_USERS
+        if len(users) > limit:
+            raise serializers.ValidationError(
+                f'At most {limit} users per request; use "manage.py provision_users" for more.'
+            )
+        return users
@@ -1,3 +1,428 @@
-from django.test import TestCase
+import importlib
+import json
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from cart.models import Cart
+from tienda_backend.authentication import CachedJWTAuthentication
+from . import hashing, provisioning, tokens
+from .models import UserProfile
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cached', password='secret-pass-123')
+        self.header = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def authenticate(self):
+        request = APIRequestFactory().get('/api/users/me/', HTTP_AUTHORIZATION=self.header)
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_warm_cache_authenticates_without_queries(self):
+        self.assertEqual(self.authenticate(), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().username, 'cached')
+
+        response = self.client.get('/api/users/me/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.data['username'], 'cached')
+
+    def test_saving_or_deleting_the_user_invalidates_it(self):
+        self.authenticate()
+        self.user.first_name = 'Renamed'
+        self.user.save()
+        self.assertEqual(self.authenticate().first_name, 'Renamed')
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/users/me/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 401)
+
+        self.user.delete()
+        response = self.client.get('/api/users/me/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 401)
+
+    def test_claims_only_is_off_with_a_per_process_cache(self):
+        # What another process sees: the user is inactive, and its cache has
+        # no entry for it
+        Cart.objects.create(user=self.user)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get('/api/cart/my_cart/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_CLAIMS_ONLY=True)
+    def test_claims_only_reads_never_load_the_user(self):
+        Cart.objects.create(user=self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/cart/my_cart/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user'], self.user.id)
+        self.assertFalse([query for query in context.captured_queries if '"auth_user"' in query['sql']])
+        self.assertIsNone(cache.get(f'auth:user:{self.user.id}'))
+
+    @override_settings(AUTH_CLAIMS_ONLY=True)
+    def test_claims_only_reads_reject_inactive_and_deleted_users(self):
+        Cart.objects.create(user=self.user)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get('/api/cart/my_cart/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 401)
+
+        # Still rejected once the token's user is gone, and no cart is created for it
+        user_id = self.user.id
+        self.user.delete()
+        cache.clear()
+        response = self.client.get('/api/cart/my_cart/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Cart.objects.filter(user_id=user_id).exists())
+
+    @override_settings(AUTH_CLAIMS_ONLY=True)
+    def test_claims_only_reads_create_carts_for_real_users(self):
+        response = self.client.get('/api/cart/my_cart/', HTTP_AUTHORIZATION=self.header)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Cart.objects.filter(user=self.user).exists())
+
+
+@override_settings(TOKEN_BLACKLIST_FILTER=True)
+class TokenBlacklistTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(tokens, 'blacklist', tokens.Blacklist(background=False))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='rotating', password='secret-pass-123')
+        self.refresh = str(RefreshToken.for_user(self.user))
+
+    def test_rotated_and_logged_out_tokens_are_rejected(self):
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        rotated = response.data['refresh']
+        response = self.client.post('/api/token/refresh/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.client.post('/api/users/logout/', {'refresh': rotated}, format='json')
+        response = self.client.post('/api/token/refresh/', {'refresh': rotated}, format='json')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post('/api/token/verify/', {'token': rotated}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_unlisted_tokens_skip_the_database(self):
+        tokens.FilteredRefreshToken(self.refresh)
+        with self.assertNumQueries(0):
+            tokens.FilteredRefreshToken(self.refresh)
+
+    def test_entries_of_other_processes_are_synced(self):
+        tokens.FilteredRefreshToken(self.refresh)
+        # Blacklisted elsewhere: no signal here, only the shared stamp changes
+        BlacklistedToken.objects.bulk_create([
+            BlacklistedToken(token=OutstandingToken.objects.get(jti=RefreshToken(self.refresh)['jti']))
+        ])
+        cache.set(tokens.STAMP_KEY, 'elsewhere', None)
+        with self.settings(TOKEN_BLACKLIST_FILTER_SYNC=0), self.assertRaises(TokenError):
+            tokens.FilteredRefreshToken(self.refresh)
+
+    def test_filter_is_off_with_a_per_process_cache(self):
+        with self.settings(TOKEN_BLACKLIST_FILTER=None):
+            self.assertFalse(tokens.is_enabled())
+            with self.assertNumQueries(1):
+                tokens.FilteredRefreshToken(self.refresh)
+
+    def test_rebuilds_run_in_the_background(self):
+        blacklist = tokens.Blacklist()
+        with mock.patch.object(tokens.threading, 'Thread') as thread:
+            # The database answers until the first filter is built
+            self.assertTrue(blacklist.might_contain('some-jti'))
+            self.assertTrue(blacklist.might_contain('some-jti'))
+        thread.assert_called_once_with(target=blacklist.rebuild, name='token-blacklist-rebuild', daemon=True)
+
+        # What the thread runs (it closes its own connection, not this one)
+        blacklist.background = False
+        blacklist.rebuild()
+        self.assertFalse(blacklist.might_contain('some-jti'))
+        blacklist.background = True
+        blacklist.rebuild_started_at = None
+        with self.settings(TOKEN_BLACKLIST_FILTER_REBUILD=0), mock.patch.object(tokens.threading, 'Thread') as thread:
+            # A stale filter keeps answering while the new one is built
+            self.assertFalse(blacklist.might_contain('some-jti'))
+        thread.assert_called_once()
+
+    def test_filter_has_no_false_negatives(self):
+        jti_filter = tokens.JtiFilter(1000, 0.01)
+        for i in range(1000):
+            jti_filter.add(f'listed-{i}')
+        self.assertTrue(all(f'listed-{i}' in jti_filter for i in range(1000)))
+        false_positives = sum(f'unlisted-{i}' in jti_filter for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_purge_deletes_expired_tokens(self):
+        expired = [
+            OutstandingToken.objects.create(
+                user=self.user, jti=f'expired-{i}', token='', expires_at=timezone.now() - timedelta(minutes=1),
+            )
+            for i in range(3)
+        ]
+        BlacklistedToken.objects.create(token=expired[0])
+
+        out = StringIO()
+        call_command('purge_expired_tokens', batch_size=2, stdout=out)
+        self.assertIn('Deleted 3 expired tokens', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+@override_settings(PASSWORD_HASH_ITERATIONS=1000, PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_QUEUE=0)
+class PasswordHashingTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='hashed', password='secret-pass-123')
+
+    def login(self, username='hashed', address='10.0.0.1'):
+        return self.client.post(
+            '/api/users/login/', {'username': username, 'password': 'secret-pass-123'},
+            format='json', REMOTE_ADDR=address,
+        )
+
+    def test_pooled_hashes_match_django(self):
+        hasher = hashing.PooledPBKDF2PasswordHasher()
+        expected = PBKDF2PasswordHasher().encode('secret', 'salt1234', 1000)
+        self.assertEqual(hasher.encode('secret', 'salt1234'), expected)
+        with hashing.offloaded():
+            self.assertEqual(hasher.encode('secret', 'salt1234'), expected)
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+        self.assertEqual(self.login().status_code, 200)
+        response = self.client.post('/api/users/register/', {
+            'username': 'newcomer', 'email': 'new@example.com',
+            'password': 'another-pass-456', 'password_confirm': 'another-pass-456',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(username='newcomer').check_password('another-pass-456'))
+
+    def test_saturated_pool_rejects_at_once(self):
+        pool = hashing.HashingPool(1, 0)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+        running = pool.submit(release.wait)
+        with self.assertRaises(hashing.HashingBusy):
+            pool.submit(release.wait)
+        release.set()
+        running.result()
+        self.assertTrue(pool.run(lambda: True))
+
+        with mock.patch.object(hashing.HashingPool, 'submit', side_effect=hashing.HashingBusy):
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_login_is_throttled_per_username_and_address(self):
+        with self.settings(AUTH_THROTTLE_RATES={'login_username': '2/min', 'login_ip': '2/min'}):
+            self.assertEqual(self.login(address='10.0.0.1').status_code, 200)
+            self.assertEqual(self.login(address='10.0.0.2').status_code, 200)
+            self.assertEqual(self.login(address='10.0.0.3').status_code, 429)
+            # Other accounts from the same address, up to its own limit
+            self.assertEqual(self.login('someone-else', address='10.0.0.1').status_code, 401)
+            self.assertEqual(self.login('third', address='10.0.0.1').status_code, 429)
+
+
+class LoginBenchmarkTest(unittest.TestCase):
+    def test_command_reports_both_modes(self):
+        out = StringIO()
+        call_command('benchmark_login', concurrency=2, seconds=0.2, iterations=1000, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[:2] for line in lines[1:]], [
+            ['inline', '1'], ['inline', '2'], ['pool', '1'], ['pool', '2'],
+        ])
+
+
+class LazyProfileTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='lazy', password='secret-pass-123')
+        self.client.force_authenticate(self.user)
+
+    def test_users_are_saved_without_profile_writes(self):
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+        with CaptureQueriesContext(connection) as context:
+            self.user.first_name = 'Renamed'
+            self.user.save()
+        self.assertFalse([query for query in context.captured_queries if 'users_userprofile' in query['sql']])
+
+        # Reading shows a blank profile and still writes nothing
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['profile'], {
+            'phone': '', 'address': '', 'city': '', 'postal_code': '', 'country': '',
+        })
+        self.assertFalse(UserProfile.objects.filter(user=self.user).exists())
+
+    def test_my_profile_creates_it_on_first_use(self):
+        response = self.client.get('/api/profiles/my_profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserProfile.objects.filter(user=self.user).count(), 1)
+
+        self.client.get('/api/profiles/my_profile/')
+        self.assertEqual(UserProfile.objects.filter(user=self.user).count(), 1)
+
+    def test_updates_save_only_changed_fields(self):
+        self.client.patch('/api/profiles/my_profile/', {'city': 'Lima'}, format='json')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch('/api/profiles/my_profile/', {'phone': '555', 'city': 'Lima'}, format='json')
+        self.assertEqual(response.data['phone'], '555')
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"phone"', updates[0])
+        self.assertNotIn('"city"', updates[0])
+        self.assertNotIn('"address"', updates[0])
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.patch('/api/profiles/my_profile/', {'phone': '555'}, format='json')
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(UserProfile.objects.get(user=self.user).city, 'Lima')
+
+    def test_migration_backfills_missing_profiles(self):
+        User.objects.bulk_create([User(username=f'bulk-{i}') for i in range(3)])
+        UserProfile.objects.create(user=self.user, city='Lima')
+        migration = importlib.import_module('users.migrations.0004_backfill_user_profiles')
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill_user_profiles(apps, SimpleNamespace(connection=connection))
+        self.assertEqual(UserProfile.objects.count(), User.objects.count())
+        self.assertEqual(UserProfile.objects.get(user=self.user).city, 'Lima')
+
+
+@override_settings(
+    PASSWORD_HASH_ITERATIONS=1000, PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_QUEUE=0, USER_PROVISIONING_WORKERS=1,
+)
+class ProvisioningTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff', password='secret-pass-123', is_staff=True)
+        self.client.force_authenticate(self.staff)
+
+    def provision(self, users, **data):
+        return self.client.post('/api/users/provision/', {'users': users, **data}, format='json')
+
+    def test_staff_provision_users_with_profiles_and_tokens(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.provision([
+                {'username': 'bulk-1', 'password': 'bulk-pass-1', 'email': 'b1@example.com', 'profile': {'city': 'Lima'}},
+                {'username': 'bulk-2', 'password': 'bulk-pass-2'},
+                {'username': 'bulk-2', 'password': 'repeated'},
+                {'username': 'staff', 'password': 'taken'},
+            ], tokens=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['skipped'], ['bulk-2', 'staff'])
+        inserts = [query['sql'] for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 3)
+
+        user = User.objects.get(username='bulk-1')
+        self.assertTrue(user.check_password('bulk-pass-1'))
+        self.assertEqual(user.profile.city, 'Lima')
+        self.assertTrue(User.objects.get(username='bulk-2').check_password('bulk-pass-2'))
+        self.assertTrue(User.objects.get(username='staff').check_password('secret-pass-123'))
+
+        entry = response.data['users'][0]
+        self.assertEqual(entry['id'], user.id)
+        self.assertTrue(OutstandingToken.objects.filter(user=user).exists())
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {entry["access"]}')
+        self.assertEqual(response.data['profile']['city'], 'Lima')
+        response = self.client.post('/api/token/refresh/', {'refresh': entry['refresh']}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_staff_provision_within_the_limit(self):
+        self.client.force_authenticate(User.objects.create_user(username='plain'))
+        self.assertEqual(self.provision([{'username': 'x', 'password': 'y'}]).status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        with self.settings(USER_PROVISIONING_MAX_USERS=1):
+            response = self.provision([{'username': 'x', 'password': 'y'}, {'username': 'z', 'password': 'y'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username__in=['x', 'z']).exists())
+
+    def test_saturated_sign_in_pool_rejects_before_writing(self):
+        release = threading.Event()
+        running = hashing.get_pool().submit(release.wait)
+        response = self.provision([{'username': 'x', 'password': 'y'}])
+        self.assertEqual(response.status_code, 429)
+        self.assertFalse(User.objects.filter(username='x').exists())
+        release.set()
+        running.result()
+
+        response = self.provision([{'username': 'x', 'password': 'y'}, {'username': 'z', 'password': 'y'}])
+        self.assertEqual(response.data['created'], 2)
+
+    def test_shared_pool_hashes_in_parallel_on_one_slot_per_worker(self):
+        pool = hashing.HashingPool(2, 2)
+        self.addCleanup(pool.shutdown)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def work(value):
+            with lock:
+                running.append(value)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(value)
+            return value * 2
+
+        self.assertEqual(pool.map(work, [(value,) for value in range(6)]), [0, 2, 4, 6, 8, 10])
+        self.assertEqual(max(peak), 2)
+
+    def test_pooled_hashes_verify(self):
+        with provisioning.hashing_executor(workers=2, executor='thread') as pool:
+            hashes = provisioning.hash_passwords(['first', 'second', 'third'], pool)
+        self.assertEqual(len(set(hashes)), 3)
+        for password, encoded in zip(['first', 'second', 'third'], hashes):
+            self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+            self.assertTrue(PBKDF2PasswordHasher().verify(password, encoded))
+
+    def test_command_reads_qa_files_and_generates_users(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as source:
+            json.dump([{
+                'username': 'pedro01', 'mail': 'pedro1@gmail.com', 'password': '123456',
+                'password_confirm': '123456', 'nombre': 'Pedro', 'apellido': 'Martinez',
+            }], source)
+            source.flush()
+            out = StringIO()
+            call_command('provision_users', source.name, stdout=out)
+        self.assertIn('Created 1 users (0 skipped)', out.getvalue())
+        user = User.objects.get(username='pedro01')
+        self.assertEqual((user.email, user.first_name, user.last_name), ('pedro1@gmail.com', 'Pedro', 'Martinez'))
+
+        out = StringIO()
+        call_command('provision_users', count=5, batch_size=2, iterations=1, stdout=out)
+        self.assertIn('Created 5 users', out.getvalue())
+        user = User.objects.get(username='loadtest000004')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1$'))
+        self.assertEqual(UserProfile.objects.filter(user__username__startswith='loadtest').count(), 5)
+        # On a process pool, as by default
+        out = StringIO()
+        call_command('provision_users', count=3, prefix='spawned', workers=2, iterations=1, stdout=out)
+        self.assertIn('Created 3 users', out.getvalue())
+        self.assertTrue(User.objects.get(username='spawned000002').check_password('loadtest-pass-123'))
+
+        # Weaker load-test hashes are upgraded at first login
+        self.assertTrue(user.check_password('loadtest-pass-123'))
+        self.assertTrue(User.objects.get(pk=user.pk).password.startswith('pbkdf2_sha256$1000$'))
@@ -0,0 +1,40 @@
+import hashlib
+
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class AuthRateThrottle(SimpleRateThrottle):
+    """
+    Sliding-window throttle (DRF keeps the request times of the window) for
+    the sign-in actions, with its rate read from AUTH_THROTTLE_RATES[scope]
+    """
+
+    def get_rate(self):
+        return getattr(settings, 'AUTH_THROTTLE_RATES', {}).get(self.scope)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginIPThrottle(AuthRateThrottle):
+    scope = 'login_ip'
+
+
+class LoginUsernameThrottle(AuthRateThrottle):
+    """
+    Attempts per target account, whatever address they come from
+    """
+    scope = 'login_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username or not isinstance(username, str):
+            return None
+        # Hashed: usernames are not safe cache key material
+        ident = hashlib.sha256(username.lower().encode('utf-8')).hexdigest()
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class RegisterIPThrottle(AuthRateThrottle):
+    scope = 'register_ip'
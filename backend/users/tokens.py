@@ -0,0 +1,254 @@
+import hashlib
+import math
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+
+STAMP_KEY = 'auth:blacklist:stamp'
+
+# Rows blacklisted concurrently may commit out of id order: each sync
+# re-reads this many ids below the highest one it has seen
+SYNC_OVERLAP = 100
+
+MIN_CAPACITY = 10000
+
+# Seconds between attempts when a rebuild fails
+REBUILD_RETRY = 5.0
+
+
+class JtiFilter:
+    """
+    Bloom filter of blacklisted token ids: "not in the filter" is always
+    right, "in the filter" is wrong for about error_rate of the tokens that
+    were never blacklisted, which then cost the usual database lookup
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.capacity = capacity
+        self.count = 0
+
+    def positions(self, jti):
+        digest = hashlib.blake2b(jti.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, jti):
+        for position in self.positions(jti):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, jti):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(jti))
+
+
+class Blacklist:
+    """
+    The process's copy of the blacklist as a JtiFilter. It is rebuilt from
+    the unexpired blacklisted tokens every TOKEN_BLACKLIST_FILTER_REBUILD
+    seconds (or when it fills up) on a background thread: requests keep
+    using the current filter meanwhile, and the database until the first
+    one is built. Tokens blacklisted by this process are added at once;
+    those of other processes change a stamp in the shared cache, and the
+    rows added since the last sync are read when it changed, at most every
+    TOKEN_BLACKLIST_FILTER_SYNC seconds. That bounds how long another
+    process can miss a new entry, so rotation does not cost a sync query
+    per refresh.
+
+    background=False rebuilds on the calling thread instead.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        self.lock = threading.Lock()
+        self.filter = None
+        self.built_at = 0.0
+        self.synced_at = 0.0
+        self.last_id = 0
+        self.stamp = None
+        self.rebuilding = False
+        self.rebuild_started_at = None
+
+    def might_contain(self, jti):
+        if self.filter is None or self.is_stale():
+            self.start_rebuild()
+        if self.filter is None:
+            # Not built yet: only the database can tell
+            return True
+        if self.lock.acquire(blocking=False):
+            # Other threads keep using the current filter meanwhile
+            try:
+                self.sync_if_changed()
+            finally:
+                self.lock.release()
+        return jti in self.filter
+
+    def add(self, jti):
+        jti_filter = self.filter
+        if jti_filter is not None:
+            jti_filter.add(jti)
+
+    def is_stale(self):
+        return (
+            time.monotonic() - self.built_at >= get_rebuild_seconds()
+            or self.filter.count > self.filter.capacity
+        )
+
+    def start_rebuild(self):
+        with self.lock:
+            started_at = self.rebuild_started_at
+            if self.rebuilding or (started_at is not None and time.monotonic() - started_at < REBUILD_RETRY):
+                return
+            self.rebuilding = True
+            self.rebuild_started_at = time.monotonic()
+        if self.background:
+            threading.Thread(target=self.rebuild, name='token-blacklist-rebuild', daemon=True).start()
+        else:
+            self.rebuild()
+
+    def rebuild(self):
+        try:
+            # Read before the rows: entries committed meanwhile change it again
+            stamp = get_stamp()
+            tokens = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            jti_filter = JtiFilter(max(MIN_CAPACITY, 2 * tokens.count()), get_error_rate())
+            last_id = 0
+            for token_id, jti in tokens.values_list('id', 'token__jti').iterator(chunk_size=10000):
+                jti_filter.add(jti)
+                last_id = max(last_id, token_id)
+            with self.lock:
+                self.filter = jti_filter
+                self.last_id = last_id
+                self.stamp = stamp
+                self.built_at = self.synced_at = time.monotonic()
+        finally:
+            self.rebuilding = False
+            if self.background:
+                connection.close()
+
+    def sync_if_changed(self):
+        now = time.monotonic()
+        if now - self.synced_at < get_sync_seconds():
+            return
+        stamp = get_stamp()
+        if stamp != self.stamp:
+            self.sync()
+        self.stamp = stamp
+        self.synced_at = now
+
+    def sync(self):
+        rows = BlacklistedToken.objects.filter(id__gt=self.last_id - SYNC_OVERLAP).values_list('id', 'token__jti')
+        for token_id, jti in rows:
+            self.filter.add(jti)
+            self.last_id = max(self.last_id, token_id)
+
+
+blacklist = Blacklist()
+
+
+def get_cache():
+    return caches[getattr(settings, 'TOKEN_BLACKLIST_CACHE_ALIAS', 'default')]
+
+
+def get_error_rate():
+    return getattr(settings, 'TOKEN_BLACKLIST_FILTER_ERROR_RATE', 0.001)
+
+
+def get_rebuild_seconds():
+    return getattr(settings, 'TOKEN_BLACKLIST_FILTER_REBUILD', 3600)
+
+
+def get_sync_seconds():
+    return getattr(settings, 'TOKEN_BLACKLIST_FILTER_SYNC', 1.0)
+
+
+def get_stamp():
+    cache = get_cache()
+    stamp = cache.get(STAMP_KEY)
+    if stamp is None:
+        # Lost from the cache: a new stamp makes every process sync
+        cache.add(STAMP_KEY, uuid.uuid4().hex, None)
+        stamp = cache.get(STAMP_KEY)
+    return stamp
+
+
+def is_enabled():
+    enabled = getattr(settings, 'TOKEN_BLACKLIST_FILTER', None)
+    if enabled is None:
+        # A per-process cache never tells the other processes about new entries
+        return not isinstance(get_cache(), (LocMemCache, DummyCache))
+    return enabled
+
+
+def token_blacklisted(jti):
+    """
+    Record a newly blacklisted token: this process sees it at once, the
+    others on their next check once the transaction commits
+    """
+    blacklist.add(jti)
+    transaction.on_commit(lambda: get_cache().set(STAMP_KEY, uuid.uuid4().hex, None))
+
+
+def is_blacklisted(jti):
+    if is_enabled() and not blacklist.might_contain(jti):
+        return False
+    return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist check only queries the database for the
+    tokens the filter cannot rule out
+    """
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
+class FilteredTokenVerifySerializer(TokenVerifySerializer):
+    def validate(self, attrs):
+        # Same checks as TokenVerifySerializer, blacklist through the filter
+        token = UntypedToken(attrs['token'])
+        jti = token.get(api_settings.JTI_CLAIM)
+        if api_settings.BLACKLIST_AFTER_ROTATION and jti is not None and is_blacklisted(jti):
+            raise serializers.ValidationError(_('Token is blacklisted'))
+        return {}
+
+
+def purge_expired_tokens(batch_size=1000):
+    """
+    Delete expired outstanding tokens, with their blacklist entries, in
+    batches. Returns the number of deleted outstanding tokens.
+    """
+    deleted = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            deleted += OutstandingToken.objects.filter(id__in=ids).delete()[1].get(OutstandingToken._meta.label, 0)
@@ -2,13 +2,19 @@ from django.shortcuts import render
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
-from .models import UserProfile
-from .serializers import UserSerializer, UserProfileSerializer, UserRegistrationSerializer
+from .models import UserProfile, get_profile
+from .serializers import ProvisionSerializer, UserSerializer, UserProfileSerializer, UserRegistrationSerializer
+from .tokens import FilteredRefreshToken
+from .hashing import HashingBusy, offloaded
+from .provisioning import provision_users
+from .throttling import LoginIPThrottle, LoginUsernameThrottle, RegisterIPThrottle
+from tienda_backend.pagination import UserKeysetPagination
 
 # Create your views here.
 
@@ -16,6 +22,7 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = UserKeysetPagination
     
     def get_permissions(self):
         """
@@ -25,14 +32,30 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.AllowAny]
         elif self.action in ['logout']:
             permission_classes = [permissions.AllowAny]  # Allow logout without authentication
+        elif self.action == 'provision':
+            permission_classes = [permissions.IsAdminUser]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
     
+    def get_throttles(self):
+        """
+        Sign-in actions hash passwords: limit them per address (and per username for login)
+        """
+        if self.action == 'login':
+            return [LoginIPThrottle(), LoginUsernameThrottle()]
+        if self.action == 'register':
+            return [RegisterIPThrottle()]
+        return super().get_throttles()
+    
+    def hashing_busy(self):
+        return Throttled(wait=1, detail='Too many sign-ins in progress, try again shortly.')
+    
     def get_queryset(self):
+        users = User.objects.select_related('profile')
         if self.request.user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
+            return users
+        return users.filter(id=self.request.user.id)
     
     @action(detail=False, methods=['get'])
     def me(self, request):
@@ -43,7 +66,11 @@ class UserViewSet(viewsets.ModelViewSet):
     def register(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
+            try:
+                with offloaded():
+                    user = serializer.save()
+            except HashingBusy:
+                raise self.hashing_busy()
             refresh = RefreshToken.for_user(user)
             return Response({
                 'refresh': str(refresh),
@@ -52,13 +79,40 @@ class UserViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'])
+    def provision(self, request):
+        """
+        Create many users at once (staff only): passwords hashed on the
+        sign-in hashing pool, users and profiles bulk inserted, optionally
+        with tokens. A saturated pool answers 429 before anything is written.
+        """
+        serializer = ProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        users = serializer.validated_data['users']
+        try:
+            # One batch: every hash is done before the first insert
+            created, skipped = provision_users(
+                users, batch_size=len(users), tokens=serializer.validated_data['tokens'], executor='shared',
+            )
+        except HashingBusy:
+            raise self.hashing_busy()
+        return Response({
+            'created': len(created),
+            'skipped': skipped,
+            'users': created,
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['post'])
     def login(self, request):
         username = request.data.get('username')
         password = request.data.get('password')
         
         if username and password:
-            user = authenticate(username=username, password=password)
+            try:
+                with offloaded():
+                    user = authenticate(username=username, password=password)
+            except HashingBusy:
+                raise self.hashing_busy()
             if user:
                 refresh = RefreshToken.for_user(user)
                 return Response({
@@ -80,7 +134,7 @@ class UserViewSet(viewsets.ModelViewSet):
     def logout(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
         except TokenError:
@@ -118,10 +172,18 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
     
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get', 'put', 'patch'])
     def my_profile(self, request):
-        profile = get_object_or_404(UserProfile, user=request.user)
-        serializer = self.get_serializer(profile)
+        """
+        The user's own profile, created on first use
+        """
+        profile = get_profile(request.user)
+        if request.method == 'GET':
+            serializer = self.get_serializer(profile)
+            return Response(serializer.data)
+        serializer = self.get_serializer(profile, data=request.data, partial=request.method == 'PATCH')
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
         return Response(serializer.data)
     
     def destroy(self, request, *args, **kwargs):
@@ -33,7 +33,7 @@ export default function ProductCard({ product, onAddToCart }: ProductCardProps)
             {product.name}
           </h3>
           <p className="text-sm text-gray-500 mt-1">
-            {product.category.name}
+            {typeof product.category === 'object' && product.category.name}
           </p>
         </div>
 
@@ -38,14 +38,21 @@ api.interceptors.response.use(
   }
 )
 
+// Las listas de productos son compactas (sin descripción, categoría como id);
+// las tarjetas piden la descripción y la categoría expandida
+const PRODUCT_CARD_PARAMS = {
+  fields: 'id,name,description,price,stock,category,image,is_available',
+  expand: 'category',
+}
+
 // Servicios de Productos
 export const productService = {
-  getAll: () => api.get('/products/'),
+  getAll: () => api.get('/products/', { params: PRODUCT_CARD_PARAMS }),
   getById: (id: number) => api.get(`/products/${id}/`),
   create: (data: any) => api.post('/products/', data),
   update: (id: number, data: any) => api.put(`/products/${id}/`, data),
   delete: (id: number) => api.delete(`/products/${id}/`),
-  search: (query: string) => api.get(`/products/search/?q=${query}`),
+  search: (query: string) => api.get('/products/search/', { params: { q: query, ...PRODUCT_CARD_PARAMS } }),
 }
 
 // Servicios de Categorías
@@ -55,7 +62,7 @@ export const categoryService = {
   create: (data: any) => api.post('/categories/', data),
   update: (id: number, data: any) => api.put(`/categories/${id}/`, data),
   delete: (id: number) => api.delete(`/categories/${id}/`),
-  getProducts: (id: number) => api.get(`/categories/${id}/products/`),
+  getProducts: (id: number) => api.get(`/categories/${id}/products/`, { params: PRODUCT_CARD_PARAMS }),
 }
 
 // Servicios de Usuarios
@@ -74,6 +81,11 @@ export const cartService = {
     api.post('/cart/add_item/', { product_id: productId, quantity }),
   removeItem: (productId: number) =>
     api.post('/cart/remove_item/', { product_id: productId }),
+  updateItemQuantity: (productId: number, quantity: number) =>
+    api.post('/cart/update_item_quantity/', { product_id: productId, quantity }),
+  // Varias operaciones en una sola petición (restaurar carrito, "comprar de nuevo")
+  batch: (operations: { op: 'add' | 'remove' | 'update'; product_id: number; quantity?: number }[]) =>
+    api.post('/cart/batch/', { operations }),
   checkout: (shippingAddress: string, paymentMethod: string) =>
     api.post('/cart/checkout/', { 
       shipping_address: shippingAddress, 
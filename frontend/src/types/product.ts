@@ -8,14 +8,14 @@ export interface Category {
 export interface Product {
   id: number
   name: string
-  description: string
+  description?: string // no incluida en la representación compacta
   price: number | string // Django DecimalField se serializa como string
   stock: number
-  category: Category
+  category: Category | number // id en listas, carrito y órdenes salvo ?expand=category
   image?: string
-  is_active: boolean
-  created_at: string
-  updated_at: string
+  is_active?: boolean // no incluida en la representación compacta
+  created_at?: string // no incluida en la representación compacta
+  updated_at?: string // no incluida en la representación compacta
   is_available: boolean
   quantity?: number
 }